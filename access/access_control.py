@@ -1,48 +1,11 @@
-from sign_in import login_user
+from sign_in import login_user, hash_password
 from admin_features import create_user, delete_user, approve_admin_request, manage_database, get_admin_request_list
 from user_features import ask_chatbot, request_admin_access
+from storage import get_users_db, init_storage
 import sqlite3
-import os
-import hashlib
-
-DB_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "data", "users.db"))
-
-# 폴더가 없으면 자동 생성
-if not os.path.exists(os.path.join(DB_PATH)):
-    os.makedirs(os.path.join(DB_PATH, "data"))
-
-def hash_password(password):
-    """ 비밀번호를 SHA-256 방식으로 해싱 """
-    return hashlib.sha256(password.encode()).hexdigest()
-
-def initialize_database():
-    """
-    데이터베이스가 존재하지 않을 경우 새로 생성
-    """
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-
-    # users 테이블이 없으면 생성
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            username TEXT PRIMARY KEY,
-            password TEXT NOT NULL,
-            role TEXT DEFAULT 'user'
-        )
-    ''')
-
-    # admin_requests 테이블이 없으면 생성
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS admin_requests (
-            username TEXT PRIMARY KEY
-        )
-    ''')
-
-    conn.commit()
-    conn.close()
 
 # 실행 시 데이터베이스 초기화 (테이블 없으면 생성)
-initialize_database()
+init_storage()
 
 def register_user():
     """
@@ -52,19 +15,13 @@ def register_user():
     username = input("아이디 입력: ").strip()
     password = input("비밀번호 입력: ").strip()
 
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-
     try:
-        cursor.execute("INSERT INTO users (username, password, role) VALUES (?, ?, ?)", 
-                       (username, hash_password(password), "user"))
-        conn.commit()
+        get_users_db().execute("INSERT INTO users (username, password, role) VALUES (?, ?, ?)",
+                               (username, hash_password(password), "user"))
         print(f"\n[회원가입 완료] {username}님, 회원가입이 완료되었습니다! 자동으로 로그인됩니다.")
-        conn.close()
         return username, password  # 회원가입 후 자동 로그인
     except sqlite3.IntegrityError:
         print("이미 존재하는 아이디입니다. 다른 아이디를 사용해주세요.")
-        conn.close()
         return None, None  # 회원가입 실패
 
 def user_dashboard(user_id, username):
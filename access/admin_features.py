@@ -1,59 +1,43 @@
 # super_admin, admin권한에서 가능한 기능을 함수에 구현
 import sqlite3
-import os
-from sign_in import hash_password
 
-DB_PATH = os.path.join("data", "users.db")
+try:
+    from access.sign_in import hash_password
+    from access.storage import get_users_db
+except ImportError:  # access 폴더 안에서 직접 실행할 때
+    from sign_in import hash_password
+    from storage import get_users_db
 
 def create_user(username, password):
     """
     새로운 user 계정을 생성하는 기능
     """
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-
     try:
-        cursor.execute("INSERT INTO users (username, password, role) VALUES (?, ?, ?)", 
-                       (username, hash_password(password), "user"))
-        conn.commit()
+        get_users_db().execute("INSERT INTO users (username, password, role) VALUES (?, ?, ?)",
+                               (username, hash_password(password), "user"))
         print(f"유저 계정이 생성되었습니다. (아이디: {username})")
     except sqlite3.IntegrityError:
         print("이미 존재하는 아이디입니다.")
 
-    conn.close()
-
 def delete_user(username):
     """
     유저 계정을 삭제하는 기능 (슈퍼 어드민은 삭제 불가)
     """
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-
-    cursor.execute("SELECT role FROM users WHERE username = ?", (username,))
-    result = cursor.fetchone()
+    db = get_users_db()
+    result = db.fetchone("SELECT role FROM users WHERE username = ?", (username,))
 
     if result and result[0] == "super_admin":
         print("[오류] 슈퍼 관리자는 삭제할 수 없습니다.")
-        conn.close()
         return
 
-    cursor.execute("DELETE FROM users WHERE username = ?", (username,))
-    conn.commit()
+    db.execute("DELETE FROM users WHERE username = ?", (username,))
     print(f"{username} 계정이 삭제되었습니다.")
 
-    conn.close()
-
 def get_admin_request_list():
     """
     관리자 승격 요청한 유저 목록을 조회하는 함수
     """
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-
-    cursor.execute("SELECT username FROM admin_requests")  # 요청 목록 조회
-    admin_requests = cursor.fetchall()
-
-    conn.close()
+    admin_requests = get_users_db().fetchall("SELECT username FROM admin_requests")  # 요청 목록 조회
 
     return [user[0] for user in admin_requests]  # 리스트 형태로 반환
 
@@ -61,38 +45,28 @@ def approve_admin_request(username):
     """
     관리자(admin)가 user의 admin 요청을 승인하는 기능
     """
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+    db = get_users_db()
 
     # 요청한 유저가 실제로 존재하는지 확인
-    cursor.execute("SELECT username FROM admin_requests WHERE username = ?", (username,))
-    request_exists = cursor.fetchone()
+    request_exists = db.fetchone("SELECT username FROM admin_requests WHERE username = ?", (username,))
 
     if not request_exists:
         print(f"{username}님의 관리자 권한 요청이 존재하지 않습니다.")
-        conn.close()
         return
 
-    # 유저 권한을 admin으로 변경
-    cursor.execute("UPDATE users SET role = 'admin' WHERE username = ?", (username,))
-    cursor.execute("DELETE FROM admin_requests WHERE username = ?", (username,))
-    conn.commit()
-    
+    # 유저 권한을 admin으로 변경 (두 쿼리를 한 트랜잭션으로 처리함)
+    with db.transaction() as cursor:
+        cursor.execute("UPDATE users SET role = 'admin' WHERE username = ?", (username,))
+        cursor.execute("DELETE FROM admin_requests WHERE username = ?", (username,))
+
     print(f"{username}님이 관리자로 승격되었습니다.")
-    conn.close()
 
 def manage_database():
     """
     관리자(admin)가 users.db를 확인할 수 있는 기능
     """
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-
-    cursor.execute("SELECT * FROM users")
-    users = cursor.fetchall()
+    users = get_users_db().fetchall("SELECT * FROM users")
 
     print("\n=== 현재 유저 목록 ===")
     for user in users:
         print(user)
-
-    conn.close()
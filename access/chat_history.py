@@ -0,0 +1,222 @@
+# chat_history.db의 대화 기록을 조회하고 정리하는 기능
+import argparse
+import zlib
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+
+try:
+    from access.storage import get_chat_db
+    from access.chat_log_writer import COMPRESS_MIN_BYTES, decode_response, flush_pending
+except ImportError:  # access 폴더 안에서 직접 실행할 때
+    from storage import get_chat_db
+    from chat_log_writer import COMPRESS_MIN_BYTES, decode_response, flush_pending
+
+# chat_logs.timestamp 형식 (SQLite CURRENT_TIMESTAMP와 같은 UTC 시각)
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# 삭제/압축을 나눠서 처리하는 행 수 (쓰기 잠금을 오래 잡지 않도록 함)
+MAINTENANCE_BATCH = 1000
+
+# 빈 페이지 비율이 이 값 이상일 때만 VACUUM으로 파일을 줄임
+VACUUM_FREE_RATIO = 0.2
+
+@dataclass
+class ChatLog:
+    """chat_logs의 한 행임. response는 압축을 푼 문자열임."""
+    id: int
+    user_id: str
+    query: str
+    response: str
+    timestamp: str
+
+@dataclass
+class HistoryPage:
+    """
+    keyset 방식으로 나눈 대화 기록 한 페이지임.
+    next_cursor를 다음 호출의 cursor로 넘기면 이어지는 페이지를 가져오고, None이면 마지막 페이지임.
+    OFFSET과 달리 앞 페이지 행을 다시 읽지 않으므로 기록이 많아도 페이지마다 조회 시간이 같음.
+    """
+    items: List[ChatLog] = field(default_factory=list)
+    next_cursor: Optional[Tuple[str, int]] = None
+
+def get_recent_conversations(user_id, limit=20, cursor=None, db=None):
+    """
+    유저의 최근 대화를 최신순으로 가져옴. (user_id, timestamp) 색인을 씀.
+    매개변수:
+      - user_id (str): 유저 아이디임.
+      - limit (int): 한 페이지의 최대 행 수임.
+      - cursor (tuple): 이전 페이지의 next_cursor임. None이면 가장 최근부터 가져옴.
+    반환값:
+      - HistoryPage
+    """
+    db = _chat_db(db)
+    if cursor is None:
+        rows = db.fetchall('''
+            SELECT id, user_id, query, response, timestamp FROM chat_logs
+            WHERE user_id = ?
+            ORDER BY timestamp DESC, id DESC LIMIT ?
+        ''', (user_id, limit + 1))
+    else:
+        rows = db.fetchall('''
+            SELECT id, user_id, query, response, timestamp FROM chat_logs
+            WHERE user_id = ? AND (timestamp, id) < (?, ?)
+            ORDER BY timestamp DESC, id DESC LIMIT ?
+        ''', (user_id, *cursor, limit + 1))
+    return _page(rows, limit)
+
+def get_conversations_between(start, end, user_id=None, limit=100, cursor=None, db=None):
+    """
+    [start, end) 기간의 대화를 오래된 순서로 가져옴. user_id를 주면 그 유저의 기록만 가져옴.
+    매개변수:
+      - start, end (datetime | str): 기간임. datetime은 UTC로 바꿔서 비교함.
+      - user_id (str): 유저 아이디임. None이면 모든 유저임.
+      - limit (int): 한 페이지의 최대 행 수임.
+      - cursor (tuple): 이전 페이지의 next_cursor임.
+    반환값:
+      - HistoryPage
+    """
+    db = _chat_db(db)
+    conditions = ["timestamp >= ?", "timestamp < ?"]
+    params = [_to_timestamp(start), _to_timestamp(end)]
+    if user_id is not None:
+        conditions.append("user_id = ?")
+        params.append(user_id)
+    if cursor is not None:
+        conditions.append("(timestamp, id) > (?, ?)")
+        params.extend(cursor)
+    rows = db.fetchall(f'''
+        SELECT id, user_id, query, response, timestamp FROM chat_logs
+        WHERE {" AND ".join(conditions)}
+        ORDER BY timestamp, id LIMIT ?
+    ''', (*params, limit + 1))
+    return _page(rows, limit)
+
+def get_top_questions(n=10, since=None, until=None, db=None):
+    """
+    가장 많이 들어온 질문 n개를 가져옴. 앞뒤 공백은 무시하고 같은 질문으로 셈.
+    매개변수:
+      - n (int): 가져올 질문 수임.
+      - since, until (datetime | str): 기간임. None이면 제한하지 않음.
+    반환값:
+      - [(질문, 횟수), ...] 리스트. 많은 순서임.
+    """
+    db = _chat_db(db)
+    conditions = []
+    params = []
+    if since is not None:
+        conditions.append("timestamp >= ?")
+        params.append(_to_timestamp(since))
+    if until is not None:
+        conditions.append("timestamp < ?")
+        params.append(_to_timestamp(until))
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    return db.fetchall(f'''
+        SELECT TRIM(query) AS question, COUNT(*) AS count FROM chat_logs
+        {where}
+        GROUP BY question ORDER BY count DESC, question LIMIT ?
+    ''', (*params, n))
+
+def compress_responses(min_bytes=COMPRESS_MIN_BYTES, batch_size=MAINTENANCE_BATCH, db=None):
+    """
+    압축 기능 이전에 저장된(또는 압축하지 않은) 긴 답변을 zlib으로 압축함.
+    반환값:
+      - 압축한 행 수.
+    """
+    db = _chat_db(db)
+    compressed = 0
+    last_id = 0
+    while True:
+        rows = db.fetchall('''
+            SELECT id, response FROM chat_logs
+            WHERE id > ? AND typeof(response) = 'text' AND length(CAST(response AS BLOB)) >= ?
+            ORDER BY id LIMIT ?
+        ''', (last_id, min_bytes, batch_size))
+        if not rows:
+            break
+        db.executemany("UPDATE chat_logs SET response = ? WHERE id = ?",
+                       [(zlib.compress(response.encode("utf-8")), row_id) for row_id, response in rows])
+        compressed += len(rows)
+        last_id = rows[-1][0]
+    return compressed
+
+def apply_retention(max_age_days=None, max_rows_per_user=None, vacuum=True, batch_size=MAINTENANCE_BATCH, db=None):
+    """
+    오래된 대화 기록을 지워서 chat_history.db 크기를 일정하게 유지함.
+    - max_age_days보다 오래된 기록을 지움.
+    - 유저마다 최근 max_rows_per_user개만 남김.
+    - 지운 뒤 빈 페이지가 VACUUM_FREE_RATIO 이상이면 VACUUM으로 파일을 줄이고, WAL 파일도 비움.
+    매개변수:
+      - max_age_days (int): 보관 기간(일)임. None이면 기간으로 지우지 않음.
+      - max_rows_per_user (int): 유저별 최대 보관 행 수임. None이면 제한하지 않음.
+      - vacuum (bool): 필요할 때 VACUUM을 실행할지 여부임.
+    반환값:
+      - {"deleted": 지운 행 수, "vacuumed": VACUUM 실행 여부, "free_ratio": 정리 전 빈 페이지 비율} dict.
+    """
+    db = _chat_db(db)
+    deleted = 0
+    if max_age_days is not None:
+        cutoff = _to_timestamp(datetime.now(timezone.utc) - timedelta(days=max_age_days))
+        deleted += _delete_batches(db, "SELECT id FROM chat_logs WHERE timestamp < ? LIMIT ?", (cutoff,), batch_size)
+    if max_rows_per_user is not None:
+        deleted += _delete_batches(db, '''
+            SELECT id FROM (
+                SELECT id, ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY timestamp DESC, id DESC) AS rank
+                FROM chat_logs
+            ) WHERE rank > ? LIMIT ?
+        ''', (max_rows_per_user,), batch_size)
+
+    page_count = db.fetchone("PRAGMA page_count")[0]
+    free_ratio = db.fetchone("PRAGMA freelist_count")[0] / page_count if page_count else 0.0
+    vacuumed = bool(vacuum and free_ratio >= VACUUM_FREE_RATIO)
+    with db.connection() as conn:
+        if vacuumed:
+            conn.execute("VACUUM")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    print(f"[디버그] 대화 기록 정리: {deleted}개 삭제, 빈 페이지 {free_ratio:.0%}, VACUUM {'실행' if vacuumed else '생략'}")
+    return {"deleted": deleted, "vacuumed": vacuumed, "free_ratio": free_ratio}
+
+def _delete_batches(db, select_sql, params, batch_size):
+    deleted = 0
+    while True:
+        with db.transaction() as cursor:
+            cursor.execute(f"DELETE FROM chat_logs WHERE id IN ({select_sql})", (*params, batch_size))
+            count = cursor.rowcount
+        deleted += count
+        if count < batch_size:
+            return deleted
+
+def _chat_db(db):
+    # 백그라운드 기록기에 남아 있는 기록까지 저장한 뒤 조회함
+    flush_pending()
+    return db or get_chat_db()
+
+def _page(rows, limit):
+    items = [ChatLog(row_id, user_id, query, decode_response(response), timestamp)
+             for row_id, user_id, query, response, timestamp in rows[:limit]]
+    next_cursor = (items[-1].timestamp, items[-1].id) if len(rows) > limit else None
+    return HistoryPage(items, next_cursor)
+
+def _to_timestamp(value):
+    """datetime을 chat_logs.timestamp 형식의 UTC 문자열로 바꿈. 문자열은 그대로 씀."""
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc)
+        return value.strftime(TIMESTAMP_FORMAT)
+    return value
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="chat_history.db 정리 (압축, 보관 기간, VACUUM)")
+    parser.add_argument("--max-age-days", type=int, default=None, help="이 기간보다 오래된 대화 기록을 지움")
+    parser.add_argument("--max-rows-per-user", type=int, default=None, help="유저마다 최근 기록을 이 개수만 남김")
+    parser.add_argument("--compress", action="store_true", help="압축하지 않은 긴 답변을 압축함")
+    parser.add_argument("--no-vacuum", action="store_true", help="VACUUM을 실행하지 않음")
+    parser.add_argument("--top", type=int, default=0, help="가장 많이 들어온 질문을 이 개수만큼 출력함")
+    args = parser.parse_args()
+
+    if args.compress:
+        print(f"압축한 답변: {compress_responses()}개")
+    result = apply_retention(args.max_age_days, args.max_rows_per_user, vacuum=not args.no_vacuum)
+    print(f"삭제한 기록: {result['deleted']}개, VACUUM: {result['vacuumed']}")
+    for question, count in get_top_questions(args.top) if args.top else []:
+        print(f"{count:5d}  {question}")
@@ -0,0 +1,192 @@
+# 질문/답변 기록을 백그라운드에서 모아서 저장하는 기록기
+import atexit
+import json
+import queue
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+
+try:
+    from access.storage import get_chat_db
+except ImportError:  # access 폴더 안에서 직접 실행할 때
+    from storage import get_chat_db
+
+INSERT_SQL = "INSERT INTO chat_logs (user_id, query, response, timestamp) VALUES (?, ?, ?, ?)"
+
+# 압축을 켤 때 쓰는 기본 기준임. 답변이 이 바이트 수 이상이면 zlib으로 압축해서 BLOB으로 저장함 (짧은 답변은 압축 이득이 거의 없음)
+# 압축은 기본으로 꺼져 있음. 압축한 행은 decode_response를 거쳐야 읽을 수 있으므로 앱(app.py, main.py)에서 명시적으로 켬
+COMPRESS_MIN_BYTES = 512
+
+_STOP = object()
+
+class ChatLogWriter:
+    """
+    chat_logs 기록을 큐에 넣어 두고 백그라운드 스레드가 모아서 한 트랜잭션으로 저장하는 기록기임.
+    - submit()은 큐에 넣기만 하므로 답변 경로에서 DB 쓰기와 JSON 변환 시간이 빠짐.
+    - batch_size개가 모이거나 flush_interval초가 지나면 executemany로 한 번에 커밋함.
+    - 큐 크기는 max_queue로 제한함. 큐가 가득 차면 put_timeout초까지 기다리고(back-pressure),
+      그래도 자리가 없으면 기록을 버리지 않도록 호출한 스레드에서 바로 저장함.
+    - 프로세스가 끝날 때(atexit) 남은 기록을 모두 저장함.
+    - 저장이 실패하면(예: "database is locked") retry_delay초부터 두 배씩 늘리며 write_retries번 다시 시도하고,
+      그래도 실패하면 기록을 하나씩 저장해서 문제가 되는 기록만 빼고 남김. 빠진 기록은 failed에 셈.
+    매개변수:
+      - batch_size (int): 한 번에 저장할 최대 기록 수임.
+      - flush_interval (float): 기록이 batch_size만큼 모이지 않아도 저장하는 최대 대기 시간(초)임.
+      - max_queue (int): 큐에 쌓아 둘 수 있는 최대 기록 수임.
+      - put_timeout (float): 큐가 가득 찼을 때 자리가 나기를 기다리는 시간(초)임.
+      - db (Database): 저장할 데이터베이스임. None이면 chat_history.db를 씀.
+      - compress_min_bytes (int): 이 크기 이상인 답변은 압축해서 저장함. None(기본값)이면 압축하지 않음.
+      - write_retries (int): 저장이 실패했을 때 다시 시도할 횟수임.
+      - retry_delay (float): 첫 번째 재시도 전에 기다리는 시간(초)임.
+    """
+
+    def __init__(self, batch_size=50, flush_interval=1.0, max_queue=1000, put_timeout=0.5, db=None,
+                 compress_min_bytes=None, write_retries=3, retry_delay=0.1):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.db = db
+        self.compress_min_bytes = compress_min_bytes
+        self.write_retries = write_retries
+        self.retry_delay = retry_delay
+        self.written = 0
+        self.failed = 0
+        self.batches = 0
+        self.sync_writes = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="chat-log-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, user_id, query, response):
+        """기록 하나를 큐에 넣음. 시간은 지금 시각으로 남김. (chat_logs의 기본값과 같은 UTC 형식)"""
+        timestamp = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+        record = (user_id, query, response, timestamp)
+        if self._closed:
+            self._write([record])
+            return
+        try:
+            self._queue.put(record, timeout=self.put_timeout)
+        except queue.Full:
+            print(f"[디버그] 대화 기록 큐가 가득 참 ({self._queue.maxsize}개), 바로 저장함")
+            self.sync_writes += 1
+            self._write([record])
+
+    def flush(self):
+        """지금까지 넣은 기록이 모두 저장될 때까지 기다림. (저장된 기록을 바로 읽어야 할 때 사용함)"""
+        if not self._closed:
+            self._queue.join()
+
+    def close(self):
+        """남은 기록을 모두 저장하고 스레드를 멈춤. 여러 번 호출해도 됨."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join()
+        # 멈추는 사이에 들어온 기록도 남김없이 저장함
+        leftover = []
+        while True:
+            try:
+                leftover.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+            self._queue.task_done()
+        if leftover:
+            self._write(leftover)
+
+    def _run(self):
+        stop = False
+        while not stop:
+            batch = []
+            deadline = None
+            while len(batch) < self.batch_size:
+                timeout = None if deadline is None else deadline - time.monotonic()
+                if timeout is not None and timeout <= 0:
+                    break
+                try:
+                    record = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if record is _STOP:
+                    self._queue.task_done()
+                    stop = True
+                    break
+                batch.append(record)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+            if batch:
+                try:
+                    self._write_with_retry(batch)
+                finally:
+                    for _ in batch:
+                        self._queue.task_done()
+
+    def _write_with_retry(self, batch):
+        """배치를 저장함. 실패하면 간격을 늘려 가며 다시 시도하고, 끝까지 실패하면 하나씩 저장함."""
+        delay = self.retry_delay
+        for attempt in range(self.write_retries + 1):
+            try:
+                self._write(batch)
+                return
+            except Exception as e:
+                print(f"[디버그] 대화 기록 저장 실패 ({len(batch)}개, 시도 {attempt + 1}회): {e}")
+                if attempt < self.write_retries:
+                    time.sleep(delay)
+                    delay *= 2
+        # 특정 기록 때문에 배치 전체가 실패하는 경우에도 나머지 기록은 남김
+        for record in batch:
+            try:
+                self._write([record])
+            except Exception as e:
+                self.failed += 1
+                print(f"[디버그] 대화 기록 버림 (user_id={record[0]!r}): {e}")
+
+    def _write(self, records):
+        rows = [(user_id, query, encode_response(response, self.compress_min_bytes), timestamp)
+                for user_id, query, response, timestamp in records]
+        (self.db or get_chat_db()).executemany(INSERT_SQL, rows)
+        self.written += len(rows)
+        self.batches += 1
+
+def encode_response(response, compress_min_bytes=None):
+    """
+    답변을 chat_logs.response에 저장할 값으로 바꿈.
+    dict 형태라면 JSON 문자열로 변환하고, compress_min_bytes가 주어지고 그 이상이면 zlib으로 압축한 bytes(BLOB)를 반환함.
+    """
+    text = json.dumps(response, ensure_ascii=False) if isinstance(response, dict) else str(response)
+    if compress_min_bytes is not None:
+        data = text.encode("utf-8")
+        if len(data) >= compress_min_bytes:
+            return zlib.compress(data)
+    return text
+
+def decode_response(value):
+    """chat_logs.response 값을 문자열로 되돌림. 압축된 BLOB이면 압축을 풂."""
+    if isinstance(value, (bytes, memoryview)):
+        return zlib.decompress(value).decode("utf-8")
+    return value
+
+_writer = None
+_writer_lock = threading.Lock()
+
+def get_chat_log_writer(compress_min_bytes=None):
+    """
+    프로세스에서 함께 쓰는 기록기를 반환함. 처음 호출할 때 만들고, 종료 시 남은 기록을 저장하도록 등록함.
+    compress_min_bytes를 주면 이후 기록부터 그 크기 이상인 답변을 압축함. (예: COMPRESS_MIN_BYTES)
+    """
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = ChatLogWriter()
+                atexit.register(_writer.close)
+    if compress_min_bytes is not None:
+        _writer.compress_min_bytes = compress_min_bytes
+    return _writer
+
+def flush_pending():
+    """기록기가 만들어져 있으면 큐에 남은 기록을 저장할 때까지 기다림. (조회 전에 호출함)"""
+    if _writer is not None:
+        _writer.flush()
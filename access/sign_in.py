@@ -1,8 +1,10 @@
 import sqlite3
 import hashlib
-import os
 
-DB_PATH = os.path.join("data", "users.db")
+try:
+    from access.storage import get_users_db
+except ImportError:  # access 폴더 안에서 직접 실행할 때
+    from storage import get_users_db
 
 def hash_password(password):
     """
@@ -21,19 +23,13 @@ def register_user(username, password, role="user"):
         print("[오류] 슈퍼 관리자는 생성할 수 없습니다.")
         return
 
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-
     try:
-        cursor.execute("INSERT INTO users (username, password, role) VALUES (?, ?, ?)", 
-                       (username, hash_password(password), role))
-        conn.commit()
+        get_users_db().execute("INSERT INTO users (username, password, role) VALUES (?, ?, ?)",
+                               (username, hash_password(password), role))
         print(f"계정이 생성되었습니다. (아이디: {username}, 권한: {role})")
     except sqlite3.IntegrityError:
         print("아이디가 이미 존재합니다.")
 
-    conn.close()
-
 def login_user(username, password):
     """
     사용자가 입력한 아이디와 비밀번호를 확인하여 로그인 처리
@@ -41,14 +37,8 @@ def login_user(username, password):
     :param password: 입력한 비밀번호 (DB의 해싱된 값과 비교)
     :return: 로그인 성공 여부 및 유저 권한 반환
     """
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-
-# username이 존재하는지 확인
-    cursor.execute("SELECT id, password, role FROM users WHERE username = ?", (username,))
-    result = cursor.fetchone()
-
-    conn.close()
+    # username이 존재하는지 확인
+    result = get_users_db().fetchone("SELECT id, password, role FROM users WHERE username = ?", (username,))
 
     if result is None:
         print("존재하지 않는 아이디입니다.")
@@ -104,11 +94,7 @@ if __name__ == "__main__":
 
     # 슈퍼 관리자가 생성되었는지 확인
     print("\n[슈퍼 관리자 존재 여부 확인]")
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT COUNT(*) FROM users WHERE role = 'super_admin'")
-    super_admin_exists = cursor.fetchone()[0]
-    conn.close()
+    super_admin_exists = get_users_db().fetchone("SELECT COUNT(*) FROM users WHERE role = 'super_admin'")[0]
 
     if super_admin_exists > 0:
         print("슈퍼 관리자 계정이 존재합니다.")
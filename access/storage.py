@@ -0,0 +1,185 @@
+# users.db, chat_history.db에 접근하는 공용 저장소 계층
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# 데이터베이스 경로 설정 (실행 위치와 상관없이 프로젝트의 data 폴더를 가리킴)
+DATA_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "data"))
+USERS_DB_PATH = os.path.join(DATA_DIR, "users.db")
+CHAT_DB_PATH = os.path.join(DATA_DIR, "chat_history.db")  # 유저 질문/답변 저장 DB
+
+# 다른 연결이 쓰기 잠금을 잡고 있을 때 기다리는 최대 시간(밀리초)
+BUSY_TIMEOUT_MS = 5000
+
+# 데이터베이스마다 풀에 보관할 최대 연결 수
+POOL_SIZE = 8
+
+USERS_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE NOT NULL,
+        password TEXT NOT NULL,
+        role TEXT CHECK(role IN ('user', 'admin', 'super_admin')) NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS admin_requests (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE NOT NULL
+    )
+    """,
+)
+
+CHAT_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS chat_logs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id TEXT NOT NULL,
+        query TEXT NOT NULL,
+        response TEXT NOT NULL,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    # 유저별 최근 대화 조회와 기간 조회용 색인 (access/chat_history.py)
+    "CREATE INDEX IF NOT EXISTS idx_chat_logs_user_time ON chat_logs (user_id, timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_chat_logs_time ON chat_logs (timestamp)",
+)
+
+class Database:
+    """
+    SQLite 파일 하나에 대한 연결 풀임.
+    - 쓰고 난 연결을 버리지 않고 풀에 돌려놓았다가 다시 씀. 연결은 스레드 사이에서 공유할 수 있도록
+      check_same_thread=False로 만들며, 한 번에 한 스레드만 빌려 쓰므로 동시에 쓰이지 않음.
+      (Streamlit은 rerun마다 새 스레드에서 스크립트를 실행하므로 스레드별 연결로는 재사용되지 않음)
+    - WAL 모드를 켜서 읽기와 쓰기가 서로 막지 않도록 하고, 잠금이 걸려 있으면 busy_timeout만큼 기다림.
+    - 연결마다 SQL 문을 캐시하므로(cached_statements) 같은 쿼리를 다시 준비하지 않음.
+    - 테이블 생성(schema)은 처음 연결할 때 한 번만 실행함.
+    매개변수:
+      - path (str): SQLite 파일 경로임.
+      - schema (tuple): 처음 한 번 실행할 CREATE 문들임.
+      - pool_size (int): 풀에 보관할 최대 연결 수임. 더 많이 빌려 가면 새로 만들고, 돌려받을 때 넘치는 연결은 닫음.
+    """
+
+    def __init__(self, path, schema=(), pool_size=POOL_SIZE):
+        self.path = path
+        self.schema = schema
+        self._idle = queue.LifoQueue(maxsize=pool_size)
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+
+    @contextmanager
+    def connection(self):
+        """
+        풀에서 연결을 하나 빌려 씀. 블록이 끝나면 풀에 돌려놓음.
+        예: with db.connection() as conn: conn.execute(...)
+        """
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            self._release(conn)
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._connect()
+
+    def _release(self, conn):
+        # 끝나지 않은 트랜잭션이 다음 사용자에게 넘어가지 않도록 함
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def _connect(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_MS / 1000, cached_statements=256,
+                               check_same_thread=False)
+        conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+        conn.execute("PRAGMA journal_mode = WAL")
+        # WAL 모드에서는 NORMAL이어도 커밋한 데이터가 손상되지 않으며, 커밋마다 fsync하지 않아 빠름
+        conn.execute("PRAGMA synchronous = NORMAL")
+        self._ensure_schema(conn)
+        return conn
+
+    def _ensure_schema(self, conn):
+        if self._schema_ready:
+            return
+        with self._schema_lock:
+            if not self._schema_ready:
+                with conn:
+                    for statement in self.schema:
+                        conn.execute(statement)
+                self._schema_ready = True
+
+    @contextmanager
+    def transaction(self):
+        """
+        트랜잭션 안에서 커서를 사용함. 블록이 끝나면 커밋하고, 예외가 나면 롤백함.
+        예: with db.transaction() as cursor: cursor.execute(...)
+        """
+        with self.connection() as conn:
+            with conn:
+                yield conn.cursor()
+
+    def execute(self, sql, params=()):
+        """쓰기 쿼리 하나를 실행하고 커밋함. 실행한 커서를 반환함."""
+        with self.transaction() as cursor:
+            cursor.execute(sql, params)
+        return cursor
+
+    def executemany(self, sql, rows):
+        """같은 쓰기 쿼리를 여러 행에 대해 한 트랜잭션으로 실행함."""
+        with self.transaction() as cursor:
+            cursor.executemany(sql, rows)
+        return cursor
+
+    def fetchone(self, sql, params=()):
+        with self.connection() as conn:
+            return conn.execute(sql, params).fetchone()
+
+    def fetchall(self, sql, params=()):
+        with self.connection() as conn:
+            return conn.execute(sql, params).fetchall()
+
+    def close(self):
+        """풀에 있는 연결을 모두 닫음."""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+_users_db = None
+_chat_db = None
+_db_lock = threading.Lock()
+
+def get_users_db():
+    """users.db 연결 풀을 반환함. 처음 호출할 때 한 번만 생성함."""
+    global _users_db
+    if _users_db is None:
+        with _db_lock:
+            if _users_db is None:
+                _users_db = Database(USERS_DB_PATH, USERS_SCHEMA)
+    return _users_db
+
+def get_chat_db():
+    """chat_history.db 연결 풀을 반환함. 처음 호출할 때 한 번만 생성함."""
+    global _chat_db
+    if _chat_db is None:
+        with _db_lock:
+            if _chat_db is None:
+                _chat_db = Database(CHAT_DB_PATH, CHAT_SCHEMA)
+    return _chat_db
+
+def init_storage():
+    """앱 시작 시 한 번 호출해서 두 데이터베이스의 테이블을 미리 만들어 둠."""
+    for db in (get_users_db(), get_chat_db()):
+        with db.connection():
+            pass
@@ -1,12 +1,13 @@
 # User 권한에서 가능한 기능을 함수에 구현
 import sqlite3
-import os
 from datetime import datetime
-import json
 
-# 데이터베이스 경로 설정
-DB_PATH = os.path.join("data", "users.db")
-CHAT_DB_PATH = os.path.join("data", "chat_history.db")  # 유저 질문/답변 저장 DB
+try:
+    from access.storage import get_users_db
+    from access.chat_log_writer import get_chat_log_writer
+except ImportError:  # access 폴더 안에서 직접 실행할 때
+    from storage import get_users_db
+    from chat_log_writer import get_chat_log_writer
 
 def ask_chatbot(user_id, question):
     """
@@ -22,56 +23,24 @@ def ask_chatbot(user_id, question):
     print(response)
 
 def save_chat_log(user_id, query, response):
-    """질문과 답변을 chat_history.db에 저장하는 함수"""
-    conn = sqlite3.connect(CHAT_DB_PATH)
-    cursor = conn.cursor()
-
-    # chat_logs 테이블이 없으면 생성
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS chat_logs (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id TEXT NOT NULL,
-            query TEXT NOT NULL,
-            response TEXT NOT NULL,
-            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-
-    # response가 dict 형태라면 JSON 문자열로 변환
-    response_str = json.dumps(response, ensure_ascii=False) if isinstance(response, dict) else str(response)
-
-    # 데이터 삽입
-    cursor.execute("INSERT INTO chat_logs (user_id, query, response) VALUES (?, ?, ?)",
-                   (user_id, query, response_str))
-
-    conn.commit()
-    conn.close()
+    """
+    질문과 답변을 chat_history.db에 저장하는 함수.
+    바로 저장하지 않고 백그라운드 기록기(ChatLogWriter)의 큐에 넣기만 하므로 답변 시간에 영향을 주지 않음.
+    기록기가 모아서 한 번에 저장하며, 프로그램이 끝날 때 남은 기록도 저장함.
+    """
+    get_chat_log_writer().submit(user_id, query, response)
 
 def request_admin_access(username):
     """
     유저가 관리자(admin) 권한을 요청하는 기능
     요청 사항을 DB에 저장하여 admin이 확인 가능하도록 함.
     """
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-
-    # 요청을 따로 저장하는 테이블이 없다면 생성
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS admin_requests (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        username TEXT UNIQUE NOT NULL
-    )
-    """)
-
     try:
-        cursor.execute("INSERT INTO admin_requests (username) VALUES (?)", (username,))
-        conn.commit()
+        get_users_db().execute("INSERT INTO admin_requests (username) VALUES (?)", (username,))
         print(f"{username}님이 관리자 권한을 요청했습니다.")
     except sqlite3.IntegrityError:
         print("이미 관리자 권한 요청이 진행 중입니다.")
 
-    conn.close()
-
 if __name__ == "__main__":
     # 테스트 실행
     ask_chatbot("user123", "오늘 날씨 어때?")
@@ -2,16 +2,66 @@ import streamlit as st
 import sqlite3
 import json
 from access.sign_in import login_user, register_user
-from pdf_processed.database_process import select_docs, create_vector_store
-from pdf_processed.llm_process import generate_response
 from access.user_features import save_chat_log
+from access.storage import init_storage, get_users_db, get_chat_db
+from access.chat_history import get_recent_conversations
+from access.chat_log_writer import get_chat_log_writer, COMPRESS_MIN_BYTES
 
-# 데이터베이스 설정
-CHAT_DB_PATH = "data/chat_history.db"
+# 데이터베이스 설정 (users.db, chat_history.db 경로는 access/storage.py에서 관리함)
 CHROMA_DB_PATH = "pdf_processed/chroma_langchain_db"
-
-# 벡터 저장소 초기화
-db = create_vector_store(collection_name="document_embeddings", db_path=CHROMA_DB_PATH)
+COLLECTION_NAME = "document_embeddings"
+
+# 답변 보완 반복 설정: 최대 3회, 40초 안에서 점수 0.8 이상이면 바로 종료함 (RefinementPolicy 인자)
+REFINEMENT_SETTINGS = dict(max_rounds=3, deadline_seconds=40, score_threshold=0.8)
+
+# Streamlit은 위젯을 누를 때마다 스크립트를 처음부터 다시 실행하므로,
+# 무거운 객체(DB 연결 풀, 백터 스토어, 답변 파이프라인)는 st.cache_resource로 프로세스에서 한 번만 만들어 둠.
+# 백터 스토어와 답변 파이프라인은 langchain, chromadb, openai를 불러오므로 첫 질문 때 처음 만듦. (로그인 화면은 바로 뜸)
+@st.cache_resource(show_spinner=False)
+def load_storage():
+    """사용자/대화 기록 DB의 연결 풀과 테이블을 준비함 (WAL 모드). 긴 답변은 압축해서 저장하도록 켬."""
+    init_storage()
+    get_chat_log_writer(compress_min_bytes=COMPRESS_MIN_BYTES)
+    return get_users_db(), get_chat_db()
+
+@st.cache_resource(show_spinner=False)
+def loaded_stores():
+    """
+    직전에 만든 백터 스토어를 기억해 두는 dict임. (다시 만들 때 정리하기 위해)
+    스크립트는 다시 실행할 때마다 새 모듈로 실행되므로 모듈 변수가 아니라 프로세스 공용 리소스로 둠.
+    """
+    return {}
+
+@st.cache_resource(max_entries=1, show_spinner="문서 DB를 불러오는 중...")
+def load_vector_store(version):
+    """
+    백터 저장소를 만듦. 컬렉션 버전(version)이 캐시 키이므로, ingest로 문서가 다시 적재되어
+    버전이 바뀌면 이전 스토어를 정리하고 새로 만듦.
+    """
+    from pdf_processed.database_process import create_vector_store, release_vector_store
+
+    stores = loaded_stores()
+    previous = stores.pop("db", None)
+    if previous is not None:
+        # 다른 세션이 아직 예전 스토어로 검색 중일 수 있으므로 키워드 색인은 닫지 않음 (참조가 사라지면 닫힘)
+        release_vector_store(previous, close=False)
+    db = create_vector_store(collection_name=COLLECTION_NAME, db_path=CHROMA_DB_PATH)
+    stores["db"] = db
+    print(f"[디버그] 백터 스토어 생성: {COLLECTION_NAME} (버전 {version})")
+    return db
+
+@st.cache_resource(show_spinner="답변 파이프라인을 준비하는 중...")
+def load_engine():
+    """답변 파이프라인(프롬프트, LLM, 체인)을 한 번만 만들어 공유함."""
+    from pdf_processed.llm_process import get_engine
+    return get_engine()
+
+def load_pipeline():
+    """백터 스토어(현재 컬렉션 버전)와 답변 파이프라인을 반환함."""
+    from pdf_processed.answer_cache import collection_version
+    return load_vector_store(collection_version(COLLECTION_NAME)), load_engine()
+
+load_storage()
 
 # Streamlit UI
 st.set_page_config(page_title="AI 챗봇", layout="wide")
@@ -25,6 +75,9 @@ user_pw = st.sidebar.text_input("비밀번호", type="password")
 login_btn = st.sidebar.button("로그인")
 register_btn = st.sidebar.button("회원가입")
 
+# 답변을 생성되는 대로 바로 보여줄지 선택
+stream_mode = st.sidebar.checkbox("실시간 답변 표시", value=True)
+
 if login_btn:
     user, role = login_user(user_id, user_pw)
     if user:
@@ -40,42 +93,99 @@ if register_btn:
 st.subheader("🤖 질문을 입력하세요")
 question = st.text_input("질문 입력")
 
+def show_answer(response):
+    """답변 딕셔너리(또는 JSON 문자열)를 화면에 출력함."""
+    try:
+        # 응답 데이터 확인 후 JSON 변환 여부 결정
+        if isinstance(response, str):
+            response_data = json.loads(response)
+        else:
+            response_data = response
+
+        # 질문 요약, 주요 내용, 결론 출력
+        from pdf_processed.llm_process import render_answer_markdown
+        st.markdown(render_answer_markdown(response_data))
+
+    except json.JSONDecodeError:
+        st.write("🚨 AI 응답을 처리하는 중 오류가 발생했습니다.")
+
+def get_conversation(engine, user_id):
+    """
+    세션의 대화 상태를 반환함. 처음이거나 아이디가 바뀌면 chat_logs의 최근 대화로 새로 만듦.
+    """
+    from pdf_processed.conversation import DEFAULT_HISTORY_TURNS
+
+    if st.session_state.get("conversation_user") != user_id:
+        logs = get_recent_conversations(user_id, limit=DEFAULT_HISTORY_TURNS).items
+        st.session_state["conversation"] = engine.conversation(logs)
+        st.session_state["conversation_user"] = user_id
+    return st.session_state["conversation"]
+
 if st.button("질문하기"):
     if user_id:
-        # ChromaDB에서 문서 검색
-        retrieved_docs = select_docs(db, question)
+        db, engine = load_pipeline()
+        from pdf_processed.llm_process import RefinementPolicy
+        refinement_policy = RefinementPolicy(**REFINEMENT_SETTINGS)
 
-        # LLM을 이용한 응답 생성
-        response, _ = generate_response(db, question)
+        # 후속 질문이면 앞 대화를 참고해서 독립된 질문으로 바꿈
+        conversation = get_conversation(engine, user_id)
+        query = conversation.standalone_query(question)
+        if query != question:
+            st.caption(f"🔎 검색 질문: {query}")
+
+        st.subheader("📌 AI 응답")
+        if stream_mode:
+            # 답변을 생성되는 대로 출력하고, 출력이 끝난 뒤 평가함
+            # stream()/run()이 답변 캐시를 먼저 확인하고, 캐시에 없을 때만 문서를 검색하고 다시 순서를 매김
+            stream = engine.stream(db, query)
+            placeholder = st.empty()
+            shown = ""
+            for chunk in stream:
+                shown += chunk
+                placeholder.markdown(shown)
+            # 스트리밍 중 답변 앞부분이 바뀌었으면 완성된 답변으로 다시 그림 (같은 답변이 두 번 보이지 않도록)
+            if stream.diverged:
+                placeholder.markdown(stream.markdown)
+            with st.spinner("답변을 검토하는 중..."):
+                result = stream.to_result()
+
+            # 평가 결과가 부족하면 새 질문으로 보완된 답변을 이어서 보여줌 (캐시된 답변이나 통과한 답변은 그대로 둠)
+            with st.spinner("답변을 보완하는 중..."):
+                result = engine.refine(db, result, policy=refinement_policy)
+            if result.answer is not stream.answer:
+                st.subheader("📌 보완된 답변")
+                show_answer(result.answer)
+        else:
+            # LLM을 이용한 응답 생성 (사용한 문서는 result.docs에 담김)
+            result = engine.run(db, query, policy=refinement_policy)
+            show_answer(result.answer)
+        response = result.answer
 
         # 응답 저장
         save_chat_log(user_id, question, response)
 
-        # 응답 출력
-        st.subheader("📌 AI 응답")
-        try:
-            # 응답 데이터 확인 후 JSON 변환 여부 결정
-            if isinstance(response, str):
-                response_data = json.loads(response)
-            else:
-                response_data = response
-
-            # 질문 요약 출력
-            if "question_summary" in response_data:
-                st.markdown(f"**🔎 질문 요약:** {response_data['question_summary']['summary']}")
-
-            # 주요 내용 출력
-            if "answer" in response_data and "main_content" in response_data["answer"]:
-                st.markdown("### 📌 주요 내용:")
-                for idx, content in enumerate(response_data["answer"]["main_content"]):
-                    st.markdown(f"**{idx + 1}.** {content}")
-
-            # 결론 출력
-            if "conclusion" in response_data:
-                st.markdown(f"### 🔍 결론: {response_data['conclusion']['conclusion']}")
-
-        except json.JSONDecodeError:
-            st.write("🚨 AI 응답을 처리하는 중 오류가 발생했습니다.")
+        # 답변에 사용한 문서 출력
+        with st.expander(f"📚 참고 문서 ({len(result.docs)}개)"):
+            for doc in result.docs:
+                st.markdown(f"- **page {doc.metadata.get('page', '?')}** {doc.page_content[:200]}")
+
+        # 시도별 소요 시간과 평가 점수 출력
+        with st.expander(f"⏱️ 답변 보완 {len(result.rounds)}회 (종료 사유: {result.stop_reason})"):
+            st.table([
+                {
+                    "시도": stat.round + 1,
+                    "점수": round(stat.score, 2),
+                    "검색(초)": round(stat.retrieval_seconds, 2),
+                    "재순위(초)": round(stat.rerank_seconds, 2),
+                    "답변(초)": round(stat.answer_seconds, 2),
+                    "평가(초)": round(stat.evaluation_seconds, 2),
+                    "평가 방법": stat.evaluator,
+                }
+                for stat in result.rounds
+            ])
+
+        # 화면을 모두 그린 뒤에 대화 기록을 남김 (오래된 턴을 요약에 합치는 것은 백그라운드에서 함)
+        conversation.add_turn(query, response)
 
     else:
         st.warning("❗ 먼저 로그인해주세요.")
\ No newline at end of file
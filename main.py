@@ -1,22 +1,46 @@
 import os
 import sqlite3
+from concurrent.futures import ThreadPoolExecutor
 from access.sign_in import register_user, login_user
-from pdf_processed.database_process import select_docs, create_vector_store
-from pdf_processed.llm_process import generate_response
 from access.user_features import save_chat_log
+from access.storage import init_storage
+from access.chat_history import get_recent_conversations
+from access.chat_log_writer import get_chat_log_writer, COMPRESS_MIN_BYTES
 
-# 데이터베이스 경로 설정
-USER_DB_PATH = "data/users.db"
-CHAT_DB_PATH = "data/chat_history.db"
+# 데이터베이스 설정 (users.db, chat_history.db 경로는 access/storage.py에서 관리함)
 CHROMA_DB_PATH = "pdf_processed/chroma_langchain_db"
 
-# 벡터 저장소 초기화
-db = create_vector_store(collection_name="document_embeddings", db_path=CHROMA_DB_PATH)
+def load_pipeline():
+    """
+    벡터 저장소와 답변 파이프라인을 만듦.
+    langchain, chromadb, openai를 불러오는 데 시간이 걸리므로 모듈을 import할 때 하지 않고,
+    main()이 로그인 입력을 받는 동안 백그라운드에서 실행함.
+    """
+    from pdf_processed.database_process import create_vector_store
+    from pdf_processed.llm_process import get_engine
+
+    # 벡터 저장소 초기화
+    db = create_vector_store(collection_name="document_embeddings", db_path=CHROMA_DB_PATH)
+
+    # 답변 파이프라인(프롬프트, LLM, 체인)은 프로세스에서 한 번만 만들어 공유함
+    engine = get_engine()
+    return db, engine
 
 def main():
     """
     전체 시스템 실행 함수
     """
+    # 사용자/대화 기록 DB의 연결 풀과 테이블을 준비함 (WAL 모드)
+    # import할 때 하지 않으므로 모듈을 불러오기만 해서는 DB 파일이 바뀌지 않음
+    init_storage()
+    # 긴 답변은 압축해서 저장함 (access.chat_history의 조회 함수가 압축을 풀어서 돌려줌)
+    get_chat_log_writer(compress_min_bytes=COMPRESS_MIN_BYTES)
+
+    # 로그인하는 동안 벡터 저장소와 답변 파이프라인을 미리 준비함
+    executor = ThreadPoolExecutor(max_workers=1)
+    pipeline = executor.submit(load_pipeline)
+    executor.shutdown(wait=False)
+
     print("\n[회원가입 및 로그인]")
     
     # 사용자 회원가입 또는 로그인
@@ -36,23 +60,52 @@ def main():
         else:
             print("잘못된 입력입니다. 다시 선택해주세요.")
     
+    db, engine = pipeline.result()
+    from pdf_processed.llm_process import RefinementPolicy, render_answer_markdown
+    from pdf_processed.conversation import DEFAULT_HISTORY_TURNS
+
+    # 답변 보완 반복 설정: 최대 3회, 40초 안에서 점수 0.8 이상이면 바로 종료함
+    refinement_policy = RefinementPolicy(max_rounds=3, deadline_seconds=40, score_threshold=0.8)
+
+    # 이전 대화 기록을 불러와서 후속 질문("그럼 마감일은?")을 이어서 이해할 수 있도록 함
+    conversation = engine.conversation(get_recent_conversations(user_id, limit=DEFAULT_HISTORY_TURNS).items)
+
     # 질문 처리 루프
     while True:
         question = input("질문을 입력하세요 (종료하려면 'exit' 입력): ").strip()
         if question.lower() == "exit":
             print("프로그램을 종료합니다.")
+            engine.evaluation_stats.report()
             break
         
-        # LLM을 이용해 질문을 재해석하고 적절한 문서를 검색
-        retrieved_docs = select_docs(db, question)
-        response, _ = generate_response(db, question)
+        # 후속 질문이면 앞 대화를 참고해서 독립된 질문으로 바꿈
+        query = conversation.standalone_query(question)
+
+        # 답변을 생성되는 대로 출력한 뒤 평가하고, 부족하면 보완함
+        # stream()이 답변 캐시를 먼저 확인하고, 캐시에 없을 때만 문서를 검색함 (검색한 문서는 result.docs에 담김)
+        print("\n[챗봇 응답]")
+        stream = engine.stream(db, query)
+        for chunk in stream:
+            print(chunk, end="", flush=True)
+        print()
+        # 스트리밍 중 답변 앞부분이 바뀌었으면 빠진 부분만 이어서 출력함
+        if stream.diverged:
+            print(stream.missing_text())
+        result = engine.refine(db, stream.to_result(), policy=refinement_policy)
+        response = result.answer
         
         # 결과 저장
         save_chat_log(user_id, question, response)
+        conversation.add_turn(query, response)
         
-        # 응답 출력
-        print("\n[챗봇 응답]")
-        print(response)
+        # 보완된 답변이 있으면 출력
+        if response is not stream.answer:
+            print("\n[보완된 챗봇 응답]")
+            print(render_answer_markdown(response))
+        print(f"[참고 문서] {len(result.docs)}개")
+        for stat in result.rounds:
+            print(f"[시도 {stat.round + 1}] 점수 {stat.score:.2f}, {stat.total_seconds:.1f}초, 평가 방법 {stat.evaluator}")
+        print(f"[종료 사유] {result.stop_reason}")
         print("------------------------------------")
 
 if __name__ == "__main__":
@@ -0,0 +1,237 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+
+import numpy as np
+
+# 답변 캐시 DB 경로 (chat_history.db 옆에 따로 둠)
+ANSWER_CACHE_DB_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "data", "answer_cache.db"))
+
+def normalize_query(query):
+    """
+    캐시 키로 쓸 수 있도록 질문을 정규화함.
+    유니코드 정규화(NFKC), 소문자 변환, 공백 정리, 끝의 문장부호 제거를 함.
+    예: "  수강신청   기간은?? " -> "수강신청 기간은"
+    """
+    query = unicodedata.normalize("NFKC", query or "")
+    query = " ".join(query.lower().split())
+    return query.rstrip("?!.~ ")
+
+class AnswerCache:
+    """
+    질문 -> 답변을 저장해 두는 SQLite 기반 캐시임.
+    1) 정규화한 질문이 똑같으면 바로 답변을 돌려줌.
+    2) 아니면 질문 임베딩이 가장 가까운 항목을 찾아, 코사인 유사도가 similarity_threshold 이상이면 돌려줌.
+    항목은 ttl_seconds가 지나면 만료되고, max_entries를 넘으면 가장 오래 쓰이지 않은 항목부터 지움(LRU).
+    add_documents로 컬렉션이 바뀌면 invalidate()로 해당 컬렉션의 항목을 모두 무효화함.
+    매개변수:
+      - db_path (str): 캐시 SQLite 파일 경로임.
+      - similarity_threshold (float): 임베딩 유사도 기준 값임.
+      - ttl_seconds (float): 항목 유지 시간(초)임. None이면 만료되지 않음.
+      - max_entries (int): 컬렉션별 최대 항목 수임.
+    """
+
+    def __init__(self, db_path=ANSWER_CACHE_DB_PATH, similarity_threshold=0.95,
+                 ttl_seconds=7 * 24 * 3600, max_entries=1000):
+        self.db_path = db_path
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.stats = {"exact_hits": 0, "semantic_hits": 0, "misses": 0}
+
+        self._lock = threading.Lock()
+        # 컬렉션별 임베딩 행렬: {collection: (version, [id, ...], np.ndarray)}
+        self._vectors = {}
+
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS answer_cache (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                collection TEXT NOT NULL,
+                version INTEGER NOT NULL,
+                normalized_query TEXT NOT NULL,
+                query TEXT NOT NULL,
+                embedding BLOB,
+                answer TEXT NOT NULL,
+                evaluation TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                hits INTEGER DEFAULT 0,
+                doc_ids TEXT,
+                UNIQUE (collection, version, normalized_query)
+            )
+        ''')
+        # doc_ids 열이 생기기 전에 만든 캐시 파일이면 열을 추가함
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(answer_cache)")}
+        if "doc_ids" not in columns:
+            self._conn.execute("ALTER TABLE answer_cache ADD COLUMN doc_ids TEXT")
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS collection_versions (
+                collection TEXT PRIMARY KEY,
+                version INTEGER NOT NULL
+            )
+        ''')
+        self._conn.commit()
+
+    def _version(self, collection):
+        """컬렉션의 현재 버전을 반환함. add_documents가 실행될 때마다 1씩 올라감."""
+        row = self._conn.execute("SELECT version FROM collection_versions WHERE collection = ?",
+                                 (collection,)).fetchone()
+        return row[0] if row else 0
+
+    def version(self, collection):
+        """컬렉션의 현재 버전을 반환함. 다른 프로세스(예: ingest)가 문서를 바꾸면 올라감."""
+        with self._lock:
+            return self._version(collection)
+
+    def _expired_before(self):
+        return time.time() - self.ttl_seconds if self.ttl_seconds is not None else float("-inf")
+
+    def _load_vectors(self, collection, version):
+        """해당 컬렉션/버전의 임베딩을 메모리에 올려 둠. 버전이 바뀌었을 때만 다시 읽음."""
+        cached = self._vectors.get(collection)
+        if cached is not None and cached[0] == version:
+            return cached
+        rows = self._conn.execute(
+            "SELECT id, embedding FROM answer_cache WHERE collection = ? AND version = ? AND embedding IS NOT NULL",
+            (collection, version)).fetchall()
+        ids = [row[0] for row in rows]
+        matrix = np.array([np.frombuffer(row[1], dtype=np.float32) for row in rows]) if rows else None
+        self._vectors[collection] = (version, ids, matrix)
+        return self._vectors[collection]
+
+    def lookup(self, collection, query, embed_query=None):
+        """
+        캐시에서 답변을 찾음.
+        매개변수:
+          - collection (str): 컬렉션 이름임.
+          - query (str): 사용자 질문임.
+          - embed_query (Callable): 질문을 임베딩하는 함수임. None이면 정확히 같은 질문만 찾음.
+        반환값:
+          - (cached, embedding, version): cached는 {"answer", "evaluation", "query", "match", "doc_ids"} 딕셔너리 또는 None,
+            embedding은 계산한 질문 임베딩(없으면 None), version은 조회할 때 본 컬렉션 버전임.
+            답변을 만든 뒤 store()에 embedding과 version을 그대로 넘김.
+        """
+        normalized = normalize_query(query)
+        embedding = None
+        with self._lock:
+            version = self._version(collection)
+            row = self._conn.execute(
+                "SELECT id, query, answer, evaluation, created_at, doc_ids FROM answer_cache "
+                "WHERE collection = ? AND version = ? AND normalized_query = ?",
+                (collection, version, normalized)).fetchone()
+            match = "exact"
+            if row is not None or embed_query is None:
+                return self._hit(query, row, match, embedding, version)
+
+        # 임베딩은 네트워크 호출일 수 있으므로 잠금 밖에서 계산함 (다른 스레드의 조회/저장을 막지 않도록)
+        embedding = _unit(embed_query(query))
+        with self._lock:
+            version = self._version(collection)
+            _, ids, matrix = self._load_vectors(collection, version)
+            if matrix is not None and matrix.shape[1] == embedding.shape[0]:
+                similarities = matrix @ embedding
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.similarity_threshold:
+                    row = self._conn.execute(
+                        "SELECT id, query, answer, evaluation, created_at, doc_ids FROM answer_cache WHERE id = ?",
+                        (ids[best],)).fetchone()
+                    match = f"semantic({similarities[best]:.3f})"
+            return self._hit(query, row, match, embedding, version)
+
+    def _hit(self, query, row, match, embedding, version):
+        """조회 결과를 기록하고 lookup()의 반환값을 만듦. self._lock을 잡은 상태에서 호출함."""
+        if row is None or row[4] < self._expired_before():
+            self.stats["misses"] += 1
+            return None, embedding, version
+
+        self._conn.execute("UPDATE answer_cache SET last_access = ?, hits = hits + 1 WHERE id = ?",
+                           (time.time(), row[0]))
+        self._conn.commit()
+        self.stats["exact_hits" if match == "exact" else "semantic_hits"] += 1
+        print(f"[디버그] 답변 캐시 적중({match}): {query} -> {row[1]}")
+        return {"answer": json.loads(row[2]), "evaluation": json.loads(row[3]), "query": row[1],
+                "match": match, "doc_ids": json.loads(row[5]) if row[5] else []}, embedding, version
+
+    def store(self, collection, query, answer, evaluation, embedding=None, doc_ids=None, version=None):
+        """
+        답변을 캐시에 저장함. 같은 질문이 이미 있으면 덮어씀.
+        저장할 때 만료된 항목과 max_entries를 넘는 오래된 항목을 함께 정리함.
+        doc_ids는 답변에 쓴 문서의 id임. 캐시에서 답변을 꺼낼 때 출처 문서를 다시 가져오는 데 씀.
+        version은 lookup()이 돌려준 컬렉션 버전임. 그 사이에 invalidate()로 버전이 바뀌었으면
+        답변이 바뀌기 전의 문서로 만들어진 것이므로 저장하지 않음. None이면 현재 버전으로 저장함.
+        """
+        now = time.time()
+        if embedding is not None:
+            embedding = _unit(embedding)
+        with self._lock:
+            current = self._version(collection)
+            if version is not None and version != current:
+                print(f"[디버그] 답변 캐시 저장 생략: 조회 후 컬렉션 버전이 바뀜 ({version} -> {current})")
+                return
+            version = current
+            self._conn.execute(
+                "INSERT OR REPLACE INTO answer_cache "
+                "(collection, version, normalized_query, query, embedding, answer, evaluation, created_at, last_access, doc_ids) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (collection, version, normalize_query(query), query,
+                 embedding.tobytes() if embedding is not None else None,
+                 json.dumps(answer, ensure_ascii=False), json.dumps(evaluation, ensure_ascii=False), now, now,
+                 json.dumps(list(doc_ids or []))))
+
+            # 만료된 항목과 용량을 넘는 항목(가장 오래 쓰이지 않은 것부터)을 지움
+            self._conn.execute("DELETE FROM answer_cache WHERE created_at < ?", (self._expired_before(),))
+            self._conn.execute('''
+                DELETE FROM answer_cache WHERE collection = ? AND id NOT IN (
+                    SELECT id FROM answer_cache WHERE collection = ? ORDER BY last_access DESC LIMIT ?
+                )
+            ''', (collection, collection, self.max_entries))
+            self._conn.commit()
+            self._vectors.pop(collection, None)
+
+    def invalidate(self, collection):
+        """컬렉션 버전을 올려서 기존 항목을 모두 무효화하고 지움."""
+        with self._lock:
+            self._conn.execute('''
+                INSERT INTO collection_versions (collection, version) VALUES (?, 1)
+                ON CONFLICT(collection) DO UPDATE SET version = version + 1
+            ''', (collection,))
+            self._conn.execute("DELETE FROM answer_cache WHERE collection = ?", (collection,))
+            self._conn.commit()
+            self._vectors.pop(collection, None)
+
+def _unit(vector):
+    """벡터를 float32 단위 벡터로 바꿈 (내적이 곧 코사인 유사도가 되도록 함)."""
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_answer_cache():
+    """프로세스 전체에서 함께 쓰는 AnswerCache를 반환함. 처음 호출할 때 한 번만 생성함."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = AnswerCache()
+    return _cache
+
+def invalidate_answer_cache(collection):
+    """
+    컬렉션의 캐시된 답변을 무효화함. 문서가 추가/삭제되어 기존 답변이 더 이상 맞지 않을 때 호출함.
+    캐시 파일에 버전을 기록하므로 다른 프로세스(예: 실행 중인 앱)의 캐시도 함께 무효화됨.
+    """
+    get_answer_cache().invalidate(collection)
+
+def collection_version(collection):
+    """
+    컬렉션의 현재 버전을 반환함. 문서를 추가/삭제할 때마다 올라가므로,
+    백터 스토어처럼 오래 들고 있는 객체를 다시 만들어야 하는지 판단하는 키로 씀. (app.py 참고)
+    """
+    return get_answer_cache().version(collection)
@@ -0,0 +1,149 @@
+"""
+시작 시간을 재는 벤치마크 스크립트임.
+
+사용법:
+    python -m pdf_processed.bench_startup --repeat 5
+    python -m pdf_processed.bench_startup --query "2학기 수강신청 기간은 언제인가요?" --output bench_startup.jsonl
+
+- 모듈마다 새 파이썬 프로세스에서 import 시간을 repeat번 재고 중앙값을 출력함.
+  (이미 불러온 패키지가 없는 상태의 시간이므로 앱을 처음 실행할 때와 같음)
+- 백터 스토어 생성(create_vector_store)과 답변 파이프라인 생성(RAGEngine) 시간을 잼.
+- --query를 주면 첫 질문의 검색/답변 시간과 같은 프로세스에서 다른 질문(--second-query)의 시간을 잼. (API 키가 필요함)
+  답변 캐시와 영구 임베딩 캐시를 쓰지 않으므로 여러 번 실행해도 매번 캐시 없이 검색/답변하는 시간을 잼.
+- --output을 주면 결과를 JSON 한 줄로 파일 끝에 덧붙여서 실행마다 변화를 비교할 수 있음.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+PROJECT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+# --second-query를 주지 않았을 때 두 번째로 잴 질문 (첫 질문과 달라야 함)
+SECOND_QUERY = "장학금 신청 자격과 제출 서류는 무엇인가요?"
+
+# import 시간을 잴 모듈 (앱 진입점과 무거운 패키지를 불러오는 모듈)
+MODULES = [
+    "access.sign_in",
+    "access.chat_history",
+    "pdf_processed.database_process",
+    "pdf_processed.llm_process",
+    "main",
+]
+
+_IMPORT_SNIPPET = """
+import time
+started = time.perf_counter()
+import {module}
+print(time.perf_counter() - started)
+"""
+
+_PIPELINE_SNIPPET = """
+import json, time
+timings = {{}}
+started = time.perf_counter()
+from pdf_processed.database_process import create_vector_store
+from pdf_processed.llm_process import RAGEngine
+from pdf_processed.rerank import LexicalVectorReranker
+timings["import"] = time.perf_counter() - started
+
+# 임베딩은 메모리 캐시만 써서 지난 실행에서 임베딩한 질문도 다시 임베딩함
+started = time.perf_counter()
+db = create_vector_store(collection_name={collection!r}, db_path={db_path!r}, embedding_cache_path=None)
+timings["vector_store"] = time.perf_counter() - started
+
+# get_engine()과 같은 구성이지만 답변 캐시 없이 만듦 (캐시에 남은 답변을 재지 않도록)
+started = time.perf_counter()
+engine = RAGEngine(cache=None, reranker=LexicalVectorReranker())
+timings["engine"] = time.perf_counter() - started
+
+queries = {queries!r}
+for name, query in zip(("first_query", "second_query"), queries):
+    started = time.perf_counter()
+    docs = engine.retrieve(db, query)
+    engine.run(db, query, docs=docs)
+    timings[name] = time.perf_counter() - started
+print("BENCH " + json.dumps(timings))
+"""
+
+def _run(code):
+    """프로젝트 폴더에서 새 파이썬 프로세스로 코드를 실행하고 표준 출력을 반환함."""
+    completed = subprocess.run([sys.executable, "-c", code], cwd=PROJECT_DIR, capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else "실행 실패")
+    return completed.stdout
+
+def measure_imports(modules=MODULES, repeat=5):
+    """
+    모듈마다 새 프로세스에서 import 시간을 repeat번 재서 중앙값(초)을 반환함.
+    반환값:
+      - {모듈 이름: 초 또는 오류 문자열} dict.
+    """
+    results = {}
+    for module in modules:
+        samples = []
+        try:
+            for _ in range(repeat):
+                samples.append(float(_run(_IMPORT_SNIPPET.format(module=module)).strip().splitlines()[-1]))
+            results[module] = statistics.median(samples)
+        except RuntimeError as e:
+            results[module] = f"error: {e}"
+    return results
+
+def measure_pipeline(collection, db_path, query=None, second_query=SECOND_QUERY):
+    """
+    새 프로세스에서 백터 스토어와 답변 파이프라인을 만들고, query가 있으면 query와 second_query의 시간을 잼.
+    반환값:
+      - {"import", "vector_store", "engine", ("first_query", "second_query")}: 초 dict.
+    """
+    if query and second_query and second_query.split() == query.split():
+        raise ValueError("second_query는 query와 다른 질문이어야 함 (공백만 다르면 같은 질문으로 봄)")
+    queries = []
+    if query:
+        queries = [query, second_query] if second_query else [query]
+    output = _run(_PIPELINE_SNIPPET.format(collection=collection, db_path=db_path, queries=queries))
+    line = next(line for line in reversed(output.splitlines()) if line.startswith("BENCH "))
+    return json.loads(line[len("BENCH "):])
+
+def report(imports, pipeline):
+    print("\n=== 시작 시간 ===")
+    for module, seconds in imports.items():
+        value = f"{seconds:7.3f}s" if isinstance(seconds, float) else seconds
+        print(f"  import {module:<34} {value}")
+    if isinstance(pipeline, dict):
+        for name, seconds in pipeline.items():
+            print(f"  {name:<41} {seconds:7.3f}s")
+    else:
+        print(f"  pipeline: {pipeline}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="import 시간과 첫 질문 응답 시간을 잼")
+    parser.add_argument("--repeat", type=int, default=5, help="모듈마다 import 시간을 잴 횟수")
+    parser.add_argument("--db-path", default="pdf_processed/chroma_langchain_db", help="Chroma 저장 경로")
+    parser.add_argument("--collection", default="document_embeddings", help="컬렉션 이름")
+    parser.add_argument("--query", default=None, help="첫 질문 응답 시간을 잴 질문 (API 키 필요)")
+    parser.add_argument("--second-query", default=SECOND_QUERY, help="같은 프로세스에서 두 번째로 잴 다른 질문")
+    parser.add_argument("--skip-pipeline", action="store_true", help="import 시간만 잼")
+    parser.add_argument("--output", default=None, help="결과를 JSON 한 줄로 덧붙일 파일")
+    args = parser.parse_args(argv)
+
+    imports = measure_imports(repeat=args.repeat)
+    pipeline = None
+    if not args.skip_pipeline:
+        try:
+            pipeline = measure_pipeline(args.collection, args.db_path, args.query, args.second_query)
+        except (RuntimeError, ValueError) as e:
+            pipeline = f"error: {e}"
+    report(imports, pipeline)
+
+    if args.output:
+        with open(args.output, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"time": time.strftime("%Y-%m-%d %H:%M:%S"), "python": sys.version.split()[0],
+                                "imports": imports, "pipeline": pipeline}, ensure_ascii=False) + "\n")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,152 @@
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import Iterable, Iterator, List
+
+from langchain_core.documents import Document
+
+# 표는 행/열 구조가 깨지지 않도록 항상 혼자 하나의 청크가 됨
+STANDALONE_CATEGORIES = ("table",)
+# 제목이 나오면 새 청크를 시작함 (Upstage는 heading1 같은 이름을 씀)
+HEADING_PREFIX = "heading"
+
+_HANGUL = re.compile(r"[ᄀ-ᇿ㄰-㆏가-힣一-鿿]")
+_encoding = None
+
+def count_tokens(text):
+    """
+    텍스트의 토큰 수를 반환함.
+    tiktoken 인코딩을 쓸 수 있으면 그것으로 세고, 없으면(오프라인 등) 한글/한자는 글자당 1토큰,
+    나머지는 4글자당 1토큰으로 어림함.
+    """
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("o200k_base")
+        except Exception:
+            _encoding = False
+    if _encoding:
+        return len(_encoding.encode(text))
+    hangul = len(_HANGUL.findall(text))
+    others = len(text) - hangul - text.count(" ")
+    return hangul + (others + 3) // 4
+
+@dataclass
+class ChunkReport:
+    """
+    청크 개수와 크기(토큰) 분포를 모아 두는 자료형임. 여러 작업자 스레드에서 함께 써도 됨.
+    """
+    elements: int = 0
+    sizes: List[int] = field(default_factory=list)
+
+    def __post_init__(self):
+        self._lock = threading.Lock()
+
+    def add_element(self):
+        with self._lock:
+            self.elements += 1
+
+    def record(self, size):
+        with self._lock:
+            self.sizes.append(size)
+
+    def summary(self):
+        """청크 크기 분포를 딕셔너리로 반환함."""
+        sizes = sorted(self.sizes)
+        if not sizes:
+            return {"elements": self.elements, "chunks": 0}
+        def percentile(p):
+            return sizes[min(len(sizes) - 1, int(len(sizes) * p))]
+        return {"elements": self.elements, "chunks": len(sizes), "min": sizes[0], "max": sizes[-1],
+                "mean": sum(sizes) / len(sizes), "p50": percentile(0.5), "p90": percentile(0.9)}
+
+    def report(self):
+        summary = self.summary()
+        print("\n[청크 결과]")
+        print(f"  요소 {summary['elements']}개 -> 청크 {summary['chunks']}개")
+        if summary["chunks"]:
+            print(f"  크기(토큰): 최소 {summary['min']}, 중앙값 {summary['p50']}, 평균 {summary['mean']:.1f}, "
+                  f"p90 {summary['p90']}, 최대 {summary['max']}")
+
+def chunk_elements(documents: Iterable[Document], max_tokens=400, overlap_tokens=50,
+                   report: ChunkReport = None) -> Iterator[Document]:
+    """
+    split="element"로 파싱한 요소들을 이웃한 것끼리 합쳐서 max_tokens 이하의 청크로 만듦.
+    - 표(table)는 다른 요소와 합치지 않고 혼자 하나의 청크가 됨.
+    - 제목(heading*)이 나오면 앞 청크를 끝내고 새 청크를 시작함.
+    - 크기 때문에 청크를 나눌 때는 앞 청크의 마지막 요소들(overlap_tokens 이하)을 다음 청크 앞에 다시 넣음.
+    - max_tokens보다 큰 요소 하나는 자르지 않고 그대로 하나의 청크가 됨.
+    요소를 하나씩 받아서 청크를 하나씩 돌려주므로 제너레이터 파이프라인 안에서 쓸 수 있음.
+    매개변수:
+      - documents (Iterable[Document]): filter_tegs(_lazy)를 거친 요소들임.
+      - max_tokens (int): 청크 하나의 최대 토큰 수임.
+      - overlap_tokens (int): 이웃한 청크가 겹치는 최대 토큰 수임. 0이면 겹치지 않음.
+      - report (ChunkReport): 청크 개수와 크기 분포를 기록할 객체임.
+    반환값:
+      - 청크 Document를 하나씩 돌려줌. metadata에 page_start, page_end, element_start, element_end가 들어 있음.
+    """
+    current = []  # (Document, 토큰 수) 리스트
+
+    for doc in documents:
+        if report is not None:
+            report.add_element()
+        tokens = count_tokens(doc.page_content)
+        category = doc.metadata.get("category") or ""
+
+        if category in STANDALONE_CATEGORIES:
+            if current:
+                yield _merge(current, report)
+                current = []
+            yield _merge([(doc, tokens)], report)
+            continue
+
+        if category.startswith(HEADING_PREFIX):
+            if current:
+                yield _merge(current, report)
+            current = []
+        elif current and sum(size for _, size in current) + tokens > max_tokens:
+            yield _merge(current, report)
+            current = _overlap(current, overlap_tokens, max_tokens - tokens)
+
+        current.append((doc, tokens))
+
+    if current:
+        yield _merge(current, report)
+
+def _overlap(elements, overlap_tokens, room):
+    """앞 청크의 마지막 요소들 중 overlap_tokens와 남은 자리(room) 안에 들어가는 것만 돌려줌."""
+    kept = []
+    total = 0
+    for doc, tokens in reversed(elements[1:]):
+        if total + tokens > min(overlap_tokens, room):
+            break
+        kept.insert(0, (doc, tokens))
+        total += tokens
+    return kept
+
+def _merge(elements, report):
+    """요소들을 하나의 청크 Document로 합침. 첫 요소의 metadata(원본 파일 정보 등)를 이어받음."""
+    docs = [doc for doc, _ in elements]
+    metadata = dict(docs[0].metadata)
+    pages = [doc.metadata["page"] for doc in docs if doc.metadata.get("page") is not None]
+    element_ids = [doc.metadata["id"] for doc in docs if doc.metadata.get("id") is not None]
+    categories = list(dict.fromkeys(doc.metadata.get("category") or "" for doc in docs))
+
+    metadata.pop("coordinates", None)
+    metadata.pop("id", None)
+    metadata["category"] = categories[0] if len(categories) == 1 else "mixed"
+    metadata["categories"] = ",".join(categories)
+    metadata["elements"] = len(docs)
+    if pages:
+        metadata["page"] = min(pages)
+        metadata["page_start"] = min(pages)
+        metadata["page_end"] = max(pages)
+    if element_ids:
+        metadata["element_start"] = min(element_ids)
+        metadata["element_end"] = max(element_ids)
+
+    size = sum(tokens for _, tokens in elements)
+    if report is not None:
+        report.record(size)
+    return Document(page_content="\n".join(doc.page_content for doc in docs), metadata=metadata)
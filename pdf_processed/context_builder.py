@@ -0,0 +1,72 @@
+from pdf_processed.chunking import count_tokens
+from pdf_processed.keyword_index import html_to_text
+
+# 프롬프트의 {mmr_docs} 자리에 넣을 문맥의 기본 최대 토큰 수
+DEFAULT_CONTEXT_TOKENS = 1500
+
+# 토큰 예산이 이만큼도 남지 않으면 마지막 문서를 잘라 넣지 않고 멈춤
+MIN_PARTIAL_TOKENS = 50
+
+def build_context(docs, max_tokens=DEFAULT_CONTEXT_TOKENS):
+    """
+    검색된 문서들을 LLM에 넣을 짧은 문맥 문자열로 만듦.
+    - HTML 태그를 지우고 일반 텍스트로 바꿈 (output_format="html"로 파싱한 문서).
+    - 앞 문서에 이미 나온 요소(청크 overlap 등으로 겹친 줄)는 다시 넣지 않고, 남는 내용이 없으면 문서를 뺌.
+      (한 문서 안에서 반복되는 줄은 표나 목록의 일부이므로 지우지 않음)
+    - 문서마다 번호를 붙여 "[번호] 파일 p.쪽 #청크id" 한 줄과 본문으로 씀. 답변에서 [번호]로 출처를 밝힐 수 있음.
+    - 관련도 순서대로 넣다가 max_tokens를 넘으면 마지막 문서를 잘라 넣고 멈춤.
+    Document 리스트를 그대로 넣으면 객체 repr과 전체 metadata, HTML이 답변 체인과 평가 체인에 두 번씩 들어가므로,
+    이렇게 줄이면 시도마다 입력 토큰과 LLM 응답 시간이 줄어듦.
+    매개변수:
+      - docs (List[Document]): 관련도 순서로 정렬된 검색 문서임.
+      - max_tokens (int): 문맥의 최대 토큰 수임. None이면 자르지 않음.
+    반환값:
+      - 프롬프트에 넣을 문자열.
+    """
+    seen = set()
+    blocks = []
+    used = 0
+    for doc in docs:
+        # 청크는 요소들을 줄바꿈으로 이어 붙인 것이므로 줄(요소) 단위로 중복을 확인함
+        # 앞 문서에 나온 줄만 빼고, 한 문서 안에서 반복되는 줄(표의 같은 칸, 같은 목록 항목 등)은 그대로 둠
+        texts = [text for text in (html_to_text(piece) for piece in doc.page_content.split("\n")) if text]
+        lines = [text for text in texts if text not in seen]
+        seen.update(texts)
+        if not lines:
+            continue
+
+        header = f"[{len(blocks) + 1}] {_citation(doc)}"
+        body = "\n".join(lines)
+        tokens = count_tokens(header) + count_tokens(body) + 1
+        if max_tokens is not None and used + tokens > max_tokens:
+            remaining = max_tokens - used - count_tokens(header) - 1
+            if remaining >= MIN_PARTIAL_TOKENS:
+                blocks.append(f"{header}\n{truncate_tokens(body, remaining)}")
+            break
+        blocks.append(f"{header}\n{body}")
+        used += tokens
+
+    context = "\n\n".join(blocks)
+    print(f"[디버그] 문맥 구성: 문서 {len(docs)}개 -> {len(blocks)}개, 약 {count_tokens(context)} 토큰")
+    return context
+
+def _citation(doc):
+    """'파일 p.3-4 #9f39fad6' 형태의 출처 표시를 만듦. 없는 정보는 뺌."""
+    metadata = doc.metadata
+    parts = []
+    if metadata.get("source"):
+        parts.append(str(metadata["source"]))
+    page_start = metadata.get("page_start", metadata.get("page"))
+    page_end = metadata.get("page_end", page_start)
+    if page_start is not None:
+        parts.append(f"p.{page_start}" if page_end in (None, page_start) else f"p.{page_start}-{page_end}")
+    chunk_id = doc.id or metadata.get("content_hash")
+    if chunk_id:
+        parts.append(f"#{str(chunk_id)[:8]}")
+    return " ".join(parts)
+
+def truncate_tokens(text, max_tokens):
+    """텍스트를 max_tokens 안으로 자름. 글자 수 비율로 줄여 나감."""
+    while text and count_tokens(text) > max_tokens:
+        text = text[:int(len(text) * max_tokens / count_tokens(text) * 0.9)]
+    return text.rstrip() + " …"
@@ -0,0 +1,223 @@
+import json
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.output_parsers import StrOutputParser
+
+from pdf_processed.chunking import count_tokens
+from pdf_processed.context_builder import truncate_tokens
+
+# 질문을 바꿀 때 참고할 최근 대화 수
+DEFAULT_HISTORY_TURNS = 3
+
+# 누적 요약과 대화 한 턴(답변)의 최대 토큰 수. 대화가 길어져도 질문 재작성 프롬프트 크기가 일정하게 유지됨
+SUMMARY_TOKENS = 200
+TURN_TOKENS = 120
+
+# 마지막 대화 후 이 시간(초)이 지나면 앞 대화를 참고하지 않음. 로그인할 때도 이 시간 안의 기록만 불러옴
+HISTORY_WINDOW_SECONDS = 30 * 60
+
+# chat_logs.timestamp 형식 (UTC)
+_TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# 앞 대화를 가리키는 표현. 이런 표현이 있거나 질문이 한 단어뿐이면("마감일은?") 후속 질문으로 보고 다시 씀
+_FOLLOW_UP = re.compile(r"^(그럼|그러면|그리고|그래서|그런데|근데|또|아까|방금|다른|나머지)"
+                        r"|그거|그건|그게|그것|이거|이건|이게|이것|저거|저건|거기|그때|그날|위의|앞의")
+_SHORT_QUERY_WORDS = 2
+
+def define_conversation_prompts():
+    """
+    질문 재작성 프롬프트와 대화 요약 프롬프트를 만듦.
+    반환값:
+      - (condense_prompt, summary_prompt)
+    """
+    condense_prompt = ChatPromptTemplate.from_messages([
+        ("system", """
+            Rewrite the user's follow-up question as a single standalone question in Korean,
+            using the conversation summary and recent turns only to resolve what it refers to
+            (e.g. "그럼 마감일은?" -> "2학기 수강신청 정정 기간의 마감일은 언제인가요?").
+            - Keep the user's intent. Do not answer the question.
+            - If the question is already standalone, return it unchanged.
+            - Output only the rewritten question.
+            """),
+        ("human", """
+                # summary : {summary}
+                # recent turns : {history}
+                # follow-up question : {question}
+            """),
+    ])
+
+    summary_prompt = ChatPromptTemplate.from_messages([
+        ("system", """
+            Update the running summary of a conversation between a student and a university information chatbot.
+            Merge the new turn into the existing summary in Korean, in at most {max_words} words.
+            Keep topics, names, dates, and conditions the student asked about; drop greetings and details already answered.
+            Output only the updated summary.
+            """),
+        ("human", """
+                # summary : {summary}
+                # new turn : {turn}
+            """),
+    ])
+    return condense_prompt, summary_prompt
+
+def create_conversation_chains(llm):
+    """질문 재작성 체인과 대화 요약 체인을 만듦. 둘 다 짧은 문자열을 돌려줌."""
+    condense_prompt, summary_prompt = define_conversation_prompts()
+    return condense_prompt | llm | StrOutputParser(), summary_prompt | llm | StrOutputParser()
+
+def needs_condensing(query):
+    """
+    앞 대화를 가리키는 표현이 있거나 한 단어뿐인 질문이면 True를 반환함.
+    한국어 질문은 "수강신청 기간은?"처럼 짧아도 독립된 질문이 많으므로 단어 수만으로는 거의 판단하지 않음.
+    """
+    return bool(_FOLLOW_UP.search(query.strip())) or len(query.split()) < _SHORT_QUERY_WORDS
+
+def answer_text(answer):
+    """
+    답변(딕셔너리, 또는 chat_logs에 저장된 JSON 문자열)에서 대화 기록에 남길 결론 문장을 꺼냄.
+    결론이 없으면 답변 전체를 문자열로 씀.
+    """
+    if isinstance(answer, str):
+        try:
+            answer = json.loads(answer)
+        except json.JSONDecodeError:
+            return answer
+    if isinstance(answer, dict):
+        conclusion = (answer.get("conclusion") or {}).get("conclusion")
+        if conclusion:
+            return conclusion
+        return json.dumps(answer, ensure_ascii=False)
+    return str(answer)
+
+class Conversation:
+    """
+    한 사용자 세션의 대화 상태임. 최근 max_turns개 턴과, 그보다 오래된 턴을 합친 누적 요약만 가지고 있음.
+    후속 질문("그럼 마감일은?")은 이 내용으로 독립된 질문으로 다시 써서 검색과 답변에 사용하므로,
+    전체 대화 내용을 답변 체인에 다시 보내지 않고도 앞 대화를 이어서 답할 수 있음.
+    마지막 턴에서 window_seconds가 지난 대화는 참고하지 않고, 요약 갱신은 백그라운드 스레드에서 함.
+    매개변수:
+      - condense_chain, summary_chain: create_conversation_chains()로 만든 체인임. (RAGEngine이 한 번만 만들어 둠)
+      - max_turns (int): 그대로 보관할 최근 턴 수임. 넘치는 턴은 누적 요약에 합침.
+      - summary_tokens (int): 누적 요약의 최대 토큰 수임.
+      - turn_tokens (int): 턴 하나의 답변을 보관할 최대 토큰 수임.
+      - window_seconds (float): 앞 대화를 참고하는 시간(초)임.
+    """
+
+    def __init__(self, condense_chain, summary_chain, max_turns=DEFAULT_HISTORY_TURNS,
+                 summary_tokens=SUMMARY_TOKENS, turn_tokens=TURN_TOKENS, window_seconds=HISTORY_WINDOW_SECONDS):
+        self.condense_chain = condense_chain
+        self.summary_chain = summary_chain
+        self.max_turns = max_turns
+        self.summary_tokens = summary_tokens
+        self.turn_tokens = turn_tokens
+        self.window_seconds = window_seconds
+        self.summary = ""
+        self.turns = deque()
+        self.updated_at = 0.0  # 마지막 턴의 시각 (epoch 초)
+        self._lock = threading.Lock()
+        self._folding = None
+
+    def load(self, logs):
+        """
+        chat_logs에서 읽은 최근 대화로 상태를 채움. (예: access.chat_history.get_recent_conversations().items)
+        window_seconds보다 오래된 기록은 쓰지 않으므로, 며칠 전 대화에 맞춰 새 질문을 바꾸지 않음.
+        매개변수:
+          - logs (List[ChatLog]): 최신순 대화 기록임. 최근 max_turns개만 사용함.
+        """
+        cutoff = time.time() - self.window_seconds
+        recent = [log for log in list(logs)[:self.max_turns] if _epoch(log.timestamp) >= cutoff]
+        for log in reversed(recent):
+            self.turns.append((log.query, self._clip(answer_text(log.response), self.turn_tokens)))
+        if recent:
+            self.updated_at = _epoch(recent[0].timestamp)
+        return self
+
+    def standalone_query(self, query):
+        """
+        후속 질문을 앞 대화 없이도 검색할 수 있는 독립된 질문으로 다시 씀.
+        대화가 없거나, 마지막 대화에서 window_seconds가 지났거나, 질문이 이미 독립적으로 보이면
+        LLM을 호출하지 않고 그대로 반환함.
+        """
+        if not self.turns and not self.summary:
+            return query
+        if time.time() - self.updated_at > self.window_seconds:
+            return query
+        if not needs_condensing(query):
+            return query
+        started = time.perf_counter()
+        # 요약 갱신이 진행 중이면 끝난 요약으로 바꿈
+        folding = self._folding
+        if folding is not None:
+            folding.join()
+        with self._lock:
+            inputs = {"summary": self.summary or "(없음)", "history": self._history(), "question": query}
+        rewritten = self.condense_chain.invoke(inputs).strip()
+        print(f"[디버그] 질문 재작성: {query!r} -> {rewritten!r} ({time.perf_counter() - started:.2f}s)")
+        return rewritten or query
+
+    def add_turn(self, query, answer):
+        """
+        답변이 끝난 턴을 기록함. 최근 턴이 max_turns를 넘으면 가장 오래된 턴을 누적 요약에 합침.
+        요약은 LLM을 호출하므로 백그라운드 스레드에서 하고 바로 반환함. (다음 질문을 바꿀 때 필요하면 기다림)
+        매개변수:
+          - query (str): 사용자가 입력한 질문임.
+          - answer (dict | str): 답변임.
+        """
+        with self._lock:
+            self.turns.append((query, self._clip(answer_text(answer), self.turn_tokens)))
+            self.updated_at = time.time()
+            overflow = []
+            while len(self.turns) > self.max_turns:
+                overflow.append(self.turns.popleft())
+        if not overflow:
+            return
+        previous = self._folding
+
+        def fold():
+            # 요약은 턴 순서대로 합쳐야 하므로 앞의 요약 갱신이 끝난 뒤에 시작함
+            if previous is not None:
+                previous.join()
+            for turn in overflow:
+                try:
+                    self._fold(turn)
+                except Exception as e:
+                    print(f"[디버그] 대화 요약 갱신 실패: {e}")
+
+        self._folding = threading.Thread(target=fold, name="conversation-fold", daemon=True)
+        self._folding.start()
+
+    def _fold(self, turn):
+        """오래된 턴 하나를 누적 요약에 합침."""
+        started = time.perf_counter()
+        summary = self.summary_chain.invoke({
+            "summary": self.summary or "(없음)",
+            "turn": self._format(turn),
+            "max_words": self.summary_tokens // 2,
+        }).strip()
+        with self._lock:
+            self.summary = self._clip(summary, self.summary_tokens)
+        print(f"[디버그] 대화 요약 갱신: 약 {count_tokens(self.summary)} 토큰 ({time.perf_counter() - started:.2f}s)")
+
+    def _history(self):
+        return "\n".join(self._format(turn) for turn in self.turns) or "(없음)"
+
+    @staticmethod
+    def _format(turn):
+        query, answer = turn
+        return f"Q: {query}\nA: {answer}"
+
+    @staticmethod
+    def _clip(text, max_tokens):
+        return truncate_tokens(text, max_tokens) if count_tokens(text) > max_tokens else text
+
+def _epoch(timestamp):
+    """chat_logs.timestamp(UTC 문자열)를 epoch 초로 바꿈. 형식이 다르면 0을 반환함."""
+    try:
+        return datetime.strptime(timestamp, _TIMESTAMP_FORMAT).replace(tzinfo=timezone.utc).timestamp()
+    except (TypeError, ValueError):
+        return 0.0
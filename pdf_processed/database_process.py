@@ -72,68 +72,425 @@ if __name__ == "__main__":
     
     check_stored_documents(db)
 '''
-from langchain_community.document_loaders import TextLoader
-from langchain_chroma import Chroma
-from langchain_upstage import UpstageEmbeddings
 from dotenv import load_dotenv
-#from processed_documents import load_document
-from pdf_processed.processed_documents import load_document
+# Chroma, UpstageEmbeddings, load_document는 무거운 패키지(chromadb, openai, langchain_upstage)를 불러오므로
+# 실제로 쓰는 함수 안에서 import함. 이 모듈을 import하는 것만으로는 클라이언트를 만들지 않음.
+from pdf_processed.answer_cache import invalidate_answer_cache
+from pdf_processed.embedding_cache import CachedEmbeddings, EMBEDDING_CACHE_DB_PATH
+from pdf_processed.keyword_index import KeywordIndex
+from langchain_core.documents import Document
 
 import sys
 import os
+import hashlib
+import itertools
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, replace
 
 # 현재 작업 디렉토리 기준으로 pdf_processed 경로 추가
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "pdf_processed")))
 
 load_dotenv()
 
-def create_vector_store(collection_name, db_path, passage_embeddings=UpstageEmbeddings(model="solar-embedding-1-large-passage")):
+# 기본 문서 임베딩 모델
+PASSAGE_EMBEDDING_MODEL = "solar-embedding-1-large-passage"
+
+# mmr에서 다양성을 따질 후보 수는 돌려줄 문서 수의 최소 이 배수임
+MMR_FETCH_MULTIPLIER = 2
+
+# 제너레이터로 문서를 받을 때 한 번에 임베딩하고 저장할 기본 문서 개수
+DEFAULT_BATCH_SIZE = 64
+
+# 하이브리드 검색에서 두 순위를 합칠 때 쓰는 RRF 상수 (클수록 아래 순위의 영향이 커짐)
+RRF_K = 60
+
+# 저장소마다 재사용할 retriever의 최대 개수 (필터/페이지 범위가 질문마다 달라도 캐시가 끝없이 커지지 않도록 함)
+MAX_CACHED_RETRIEVERS = 32
+
+@dataclass(frozen=True)
+class SearchConfig:
+    """
+    문서 검색 설정임. 같은 설정이면 retriever를 한 번만 만들어 재사용함. (frozen이라 딕셔너리 키로 쓸 수 있음)
+    - mode: "vector"는 임베딩 검색만, "hybrid"는 키워드(BM25) 검색 결과와 RRF로 합침.
+    - search_type: "similarity", "mmr"(비슷한 문서가 겹치지 않도록 다양하게 고름), "similarity_score_threshold".
+    - k: 돌려줄 문서 개수임.
+    - fetch_k: mmr에서 다양성을 따지기 전에 가져올 후보 개수임. (최소 k * MMR_FETCH_MULTIPLIER개)
+    - lambda_mult: mmr에서 관련도(1.0)와 다양성(0.0) 사이의 비중임.
+    - score_threshold: similarity_score_threshold에서 최소 관련도(0.0 ~ 1.0)임.
+    - source: 이 파일(metadata["source"])의 문서만 검색함.
+    - page_range: (시작 쪽, 끝 쪽) 범위의 문서만 검색함.
+    - category: 이 종류(metadata["category"], 예: "table")의 문서만 검색함.
+    """
+    mode: str = "hybrid"
+    search_type: str = "mmr"
+    k: int = 4
+    fetch_k: int = 20
+    lambda_mult: float = 0.5
+    score_threshold: float = None
+    source: str = None
+    page_range: tuple = None
+    category: str = None
+
+    def where(self):
+        """메타데이터 조건을 Chroma where 필터로 바꿈. 조건이 없으면 None을 반환함."""
+        conditions = []
+        if self.source is not None:
+            conditions.append({"source": self.source})
+        if self.page_range is not None:
+            conditions.append({"page": {"$gte": self.page_range[0]}})
+            conditions.append({"page": {"$lte": self.page_range[1]}})
+        if self.category is not None:
+            conditions.append({"category": self.category})
+        if not conditions:
+            return None
+        return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+    def search_kwargs(self, k=None):
+        kwargs = {"k": k or self.k}
+        if self.search_type == "mmr":
+            # 하이브리드 검색처럼 k를 늘려서 부를 때도 후보가 k보다 많아야 mmr이 비슷한 문서를 걸러낼 수 있음
+            kwargs.update(fetch_k=max(self.fetch_k, kwargs["k"] * MMR_FETCH_MULTIPLIER), lambda_mult=self.lambda_mult)
+        elif self.search_type == "similarity_score_threshold":
+            kwargs["score_threshold"] = self.score_threshold if self.score_threshold is not None else 0.0
+        if self.where() is not None:
+            kwargs["filter"] = self.where()
+        return kwargs
+
+# 기본 검색 설정
+DEFAULT_SEARCH = SearchConfig()
+
+def create_vector_store(collection_name, db_path, passage_embeddings=None,
+                        embedding_cache_path=EMBEDDING_CACHE_DB_PATH, keyword_index_path=None):
     """
     백터 스토어를 생성함.
+    passage_embeddings가 None이면 이때 UpstageEmbeddings(PASSAGE_EMBEDDING_MODEL)를 만듦.
+    (기본 인자로 두면 모듈을 import할 때 클라이언트가 만들어지고 API 키가 없으면 import부터 실패함)
+    임베딩 함수는 CachedEmbeddings로 감싸서, 같은 질문을 다시 임베딩하지 않도록 함.
+    embedding_cache_path가 None이면 메모리 캐시만 사용함.
+    키워드 색인(KeywordIndex)도 함께 열어서 vector_store.keyword_index에 붙여 둠.
+    keyword_index_path가 None이면 db_path 안의 keyword_index.db를 사용함.
     """
+    from langchain_chroma import Chroma
+
+    if passage_embeddings is None:
+        from langchain_upstage import UpstageEmbeddings
+        passage_embeddings = UpstageEmbeddings(model=PASSAGE_EMBEDDING_MODEL)
+    if not isinstance(passage_embeddings, CachedEmbeddings):
+        passage_embeddings = CachedEmbeddings(passage_embeddings, persist_path=embedding_cache_path)
     vector_store = Chroma(
         collection_name=collection_name,
         embedding_function=passage_embeddings,
         persist_directory=db_path,
     )
+    vector_store.keyword_index = KeywordIndex(keyword_index_path or os.path.join(db_path, "keyword_index.db"))
     return vector_store
 
-def add_documents(vector_store, documents):
+def release_vector_store(vector_store, close=True):
+    """
+    오래 들고 있던 백터 스토어를 정리함. (예: 문서를 다시 적재해서 앱이 새 스토어를 만들 때)
+    Chroma는 같은 저장 경로의 클라이언트를 프로세스 안에서 공유하고 HNSW 색인을 메모리에 들고 있으므로,
+    공유 캐시를 비워야 새로 만든 스토어가 다른 프로세스(ingest)가 바꾼 색인을 다시 읽음.
+    (캐시에서 빼기만 하므로 예전 스토어를 들고 있는 쪽은 그대로 검색할 수 있음)
+    매개변수:
+      - close (bool): 키워드 색인 연결을 바로 닫을지 여부임. 다른 세션이 아직 예전 스토어로 검색 중일 수 있으면
+        False로 두고, 마지막 참조가 사라질 때 연결이 함께 닫히게 함.
+    """
+    from chromadb.api.shared_system_client import SharedSystemClient
+
+    keyword_index = get_keyword_index(vector_store)
+    if close and keyword_index is not None:
+        keyword_index.close()
+    SharedSystemClient.clear_system_cache()
+
+def stored_embeddings(vector_store, docs):
+    """
+    검색된 문서들의 임베딩을 컬렉션에서 id로 읽어 옴. (적재할 때 저장한 벡터이므로 임베딩 API를 호출하지 않음)
+    반환값:
+      - docs와 같은 순서의 벡터 리스트. id가 없거나 컬렉션에 없는 문서는 None임.
+    """
+    ids = list(dict.fromkeys(doc.id for doc in docs if doc.id))
+    stored = {}
+    if ids:
+        found = vector_store.get(ids=ids, include=["embeddings"])
+        stored = dict(zip(found["ids"], found["embeddings"]))
+    return [stored.get(doc.id) if doc.id else None for doc in docs]
+
+def get_documents(vector_store, ids, where=None):
+    """
+    id 순서대로 컬렉션의 문서를 가져옴. 컬렉션에 없거나 where 조건에 맞지 않는 id는 뺌.
+    """
+    ids = list(ids)
+    if not ids:
+        return []
+    found = vector_store.get(ids=ids, where=where, include=["documents", "metadatas"])
+    docs = {doc_id: Document(id=doc_id, page_content=text, metadata=metadata or {})
+            for doc_id, text, metadata in zip(found["ids"], found["documents"], found["metadatas"])}
+    return [docs[doc_id] for doc_id in ids if doc_id in docs]
+
+def get_keyword_index(vector_store):
+    """백터 스토어에 붙어 있는 키워드 색인을 반환함. 없으면 None을 반환함."""
+    return getattr(vector_store, "keyword_index", None)
+
+def content_hash(text):
+    """문서 내용(page_content)의 SHA-256 해시를 반환함."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def document_id(doc):
+    """
+    문서의 id를 내용 해시로 만듦. 같은 내용이면 언제 어디서 추가해도 같은 id가 되므로,
+    컬렉션 크기를 몰라도 id를 정할 수 있고 동시에 추가해도 id가 겹치지 않음.
+    metadata에 원본 파일(source)이 있으면 (파일, 내용 해시)로 만들어서, 여러 파일에 같은 내용이 있어도
+    청크가 파일마다 따로 저장되고 각자 자기 파일과 쪽을 가리킴. (임베딩은 내용 해시로 캐시하므로 다시 하지 않음)
+    """
+    digest = doc.metadata.get("content_hash") or content_hash(doc.page_content)
+    source = doc.metadata.get("source")
+    return content_hash(f"{source}\0{digest}") if source else digest
+
+def existing_ids(vector_store, ids):
+    """컬렉션에 이미 있는 id 집합을 반환함. (id로만 조회하고 본문, 메타데이터, 임베딩은 가져오지 않음)"""
+    existing = set()
+    ids = list(ids)
+    for start in range(0, len(ids), 500):
+        existing.update(vector_store.get(ids=ids[start:start + 500], include=[])["ids"])
+    return existing
+
+def add_documents(vector_store, documents, batch_size=None, stats=None):
     """
     문서 DB에 새로운 문서를 추가함.
+    각 문서의 page_content 해시를 metadata["content_hash"]에 기록하고, document_id()로 만든 id를 사용함.
+    이번 목록 안에서 같은 id가 반복되면 건너뜀. 같은 id가 이미 컬렉션에 있으면 임베딩은 다시 하지 않고
+    메타데이터(쪽, 파일 해시 등)만 새 값으로 바꿈. (파일을 교체해서 쪽이 바뀌어도 예전 쪽을 가리키지 않음)
+    임베딩은 CachedEmbeddings가 내용 해시로 캐시해 두므로, 전에 임베딩한 적이 있는 내용은 다시 임베딩하지 않음.
+    documents가 제너레이터(예: load_document_lazy -> filter_tegs_lazy)이면 batch_size개씩 읽어서 처리하므로,
+    메모리에는 한 배치와 이미 본 id만 남음.
+    매개변수:
+      - vector_store (Chroma): 문서 저장소 객체임.
+      - documents (Iterable[Document]): 추가할 문서들의 리스트 또는 제너레이터임.
+      - batch_size (int): 한 번에 임베딩하고 저장할 문서 개수임. None이면 리스트는 한 번에, 제너레이터는 DEFAULT_BATCH_SIZE개씩 처리함.
+      - stats (IngestStats): 단계별 처리량을 기록할 객체임. (record(stage, count, seconds) 메서드가 있으면 됨)
+    반환값:
+      - 문서가 추가된 vector_store 객체.
     """
-    all_data = vector_store.get()
-    strat = len(all_data['ids']) + 1
-    end = len(documents) + len(all_data['ids']) + 1
-    uuids = [str(i) for i in range(strat, end)]
-    vector_store.add_documents(documents=documents, ids=uuids)
+    if batch_size is None:
+        batch_size = max(len(documents), 1) if isinstance(documents, (list, tuple)) else DEFAULT_BATCH_SIZE
+
+    embeddings = vector_store.embeddings
+    hits_before = embeddings.stats["document_hits"] if isinstance(embeddings, CachedEmbeddings) else 0
+
+    total = 0
+    added = 0
+    updated = 0
+    seen = set()
+    for batch in _batched(documents, batch_size):
+        total += len(batch)
+        # 내용 해시를 기록하고, 앞에서 이미 본 내용은 제외함
+        unique_documents = {}
+        for doc in batch:
+            doc.metadata["content_hash"] = content_hash(doc.page_content)
+            doc_id = document_id(doc)
+            if doc_id not in seen:
+                seen.add(doc_id)
+                unique_documents[doc_id] = doc
+
+        # 컬렉션에 이미 있는 청크는 임베딩하지 않고 메타데이터만 갱신함 (전체 컬렉션을 읽지 않고 id로만 확인함)
+        existing = existing_ids(vector_store, unique_documents.keys())
+        kept_ids = [doc_id for doc_id in unique_documents if doc_id in existing]
+        if kept_ids:
+            vector_store._collection.update(ids=kept_ids,
+                                            metadatas=[unique_documents[doc_id].metadata for doc_id in kept_ids])
+            updated += len(kept_ids)
+        new_ids = [doc_id for doc_id in unique_documents if doc_id not in existing]
+        if not new_ids:
+            continue
+        new_documents = [unique_documents[doc_id] for doc_id in new_ids]
+        texts = [doc.page_content for doc in new_documents]
+
+        started = time.perf_counter()
+        vectors = embeddings.embed_documents(texts)
+        embedded = time.perf_counter()
+        vector_store._collection.upsert(ids=new_ids, embeddings=vectors, documents=texts,
+                                        metadatas=[doc.metadata for doc in new_documents])
+        if get_keyword_index(vector_store) is not None:
+            get_keyword_index(vector_store).add(collection_name(vector_store), new_ids, texts)
+        added += len(new_ids)
+        if stats is not None:
+            stats.record("embed", len(new_ids), embedded - started)
+            stats.record("write", len(new_ids), time.perf_counter() - embedded)
+
+    reused = (embeddings.stats["document_hits"] - hits_before) if isinstance(embeddings, CachedEmbeddings) else 0
+    skipped = total - added
+    print(f"[디버그] 문서 {total}개 중 {added}개 추가, 중복 {skipped}개 건너뜀 (그중 메타데이터 갱신 {updated}개), "
+          f"임베딩 캐시 재사용 {reused}개 (절약한 임베딩 {skipped + reused}개)")
+
+    # 문서나 출처(쪽, 파일)가 바뀌었으므로 이 컬렉션에 캐시된 답변을 무효화함
+    if added or updated:
+        invalidate_answer_cache(collection_name(vector_store))
     return vector_store
 
-def select_docs(db, query):
+def _batched(documents, batch_size):
+    """리스트나 제너레이터를 batch_size개씩 묶어서 돌려줌."""
+    iterator = iter(documents)
+    while True:
+        batch = list(itertools.islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+def delete_documents(vector_store, ids):
+    """
+    id 리스트에 해당하는 문서를 컬렉션에서 지움.
+    반환값:
+      - 문서가 삭제된 vector_store 객체.
+    """
+    ids = list(ids)
+    if not ids:
+        return vector_store
+    for start in range(0, len(ids), 500):
+        vector_store.delete(ids=ids[start:start + 500])
+    if get_keyword_index(vector_store) is not None:
+        get_keyword_index(vector_store).delete(collection_name(vector_store), ids)
+
+    # 문서가 바뀌었으므로 이 컬렉션에 캐시된 답변을 무효화함
+    invalidate_answer_cache(collection_name(vector_store))
+    return vector_store
+
+def collection_name(vector_store):
+    """백터 스토어의 컬렉션 이름을 반환함."""
+    return vector_store._collection.name
+
+def rebuild_keyword_index(vector_store, batch_size=500):
+    """
+    컬렉션에 이미 저장된 문서로 키워드 색인을 다시 만듦.
+    키워드 색인이 생기기 전에 적재한 컬렉션에 한 번 실행하면 됨. (임베딩은 다시 하지 않음)
+    반환값:
+      - 색인한 문서 개수.
+    """
+    index = get_keyword_index(vector_store)
+    name = collection_name(vector_store)
+    total = 0
+    while True:
+        batch = vector_store.get(limit=batch_size, offset=total, include=["documents"])
+        if not batch["ids"]:
+            break
+        index.add(name, batch["ids"], batch["documents"])
+        total += len(batch["ids"])
+    print(f"[디버그] 키워드 색인 재구성: {total}개 문서")
+    return total
+
+def search_config(config=None, **options):
+    """기본 설정(또는 config)에서 options로 준 값만 바꾼 SearchConfig를 반환함."""
+    config = config or DEFAULT_SEARCH
+    if "page_range" in options and options["page_range"] is not None:
+        options["page_range"] = tuple(options["page_range"])
+    return replace(config, **options) if options else config
+
+_retrievers_lock = threading.Lock()
+
+def get_retriever(db, config, k=None):
+    """
+    설정에 맞는 retriever를 반환함. 같은 저장소와 같은 설정이면 처음 만든 것을 재사용함.
+    저장소마다 최근에 쓴 MAX_CACHED_RETRIEVERS개까지만 보관하고, 넘으면 가장 오래 쓰지 않은 것부터 버림(LRU).
+    """
+    key = (config, k)
+    with _retrievers_lock:
+        retrievers = db.__dict__.setdefault("_retrievers", OrderedDict())
+        retriever = retrievers.get(key)
+        if retriever is None:
+            retriever = db.as_retriever(search_type=config.search_type, search_kwargs=config.search_kwargs(k))
+            retrievers[key] = retriever
+        retrievers.move_to_end(key)
+        while len(retrievers) > MAX_CACHED_RETRIEVERS:
+            retrievers.popitem(last=False)
+    return retriever
+
+def select_docs(db, query, config=None, **options):
     """
     데이터베이스에서 쿼리에 대한 문서를 선택함.
+    매개변수:
+      - db (Chroma): 문서 저장소 객체임.
+      - query (str): 쿼리 문장임.
+      - config (SearchConfig): 검색 설정임. None이면 DEFAULT_SEARCH를 사용함.
+      - options: config의 일부 값만 바꿔서 검색할 때 씀. (예: k=6, search_type="similarity", source="학사안내.pdf")
+        mode="hybrid"이면 임베딩 검색 결과와 키워드(BM25) 검색 결과를 RRF(reciprocal rank fusion)로 합침.
+        키워드 색인이 없으면 임베딩 검색 결과만 사용함.
+    반환값:
+      - 선택된 문서들의 리스트.
     """
-    retriever = db.as_retriever()
-    selected_docs = retriever.invoke(query)
-    return selected_docs
+    config = search_config(config, **options)
+    if config.mode == "hybrid" and get_keyword_index(db) is not None:
+        fetch_k = _hybrid_fetch_k(config.k)
+        vector_docs = get_retriever(db, config, fetch_k).invoke(query)
+        keyword_hits = get_keyword_index(db).search(collection_name(db), query, k=fetch_k)
+        return _fuse(db, vector_docs, keyword_hits, config)
+    return get_retriever(db, config).invoke(query)
+
+async def aselect_docs(db, query, config=None, **options):
+    """
+    select_docs의 asyncio 버전임. 이벤트 루프를 막지 않고 문서를 검색함.
+    하이브리드 검색에서는 임베딩 검색과 키워드 검색을 동시에 실행함.
+    """
+    config = search_config(config, **options)
+    if config.mode == "hybrid" and get_keyword_index(db) is not None:
+        fetch_k = _hybrid_fetch_k(config.k)
+        vector_docs, keyword_hits = await asyncio.gather(
+            get_retriever(db, config, fetch_k).ainvoke(query),
+            asyncio.to_thread(get_keyword_index(db).search, collection_name(db), query, fetch_k))
+        # 키워드 검색에서만 나온 문서를 컬렉션에서 가져오는 것도 블로킹 호출이므로 스레드에서 실행함
+        return await asyncio.to_thread(_fuse, db, vector_docs, keyword_hits, config)
+    return await get_retriever(db, config).ainvoke(query)
+
+def _hybrid_fetch_k(k):
+    """하이브리드 검색에서 각 검색이 가져올 후보 개수임."""
+    return max(k * 2, 20)
+
+def _fuse(db, vector_docs, keyword_hits, config):
+    """
+    임베딩 검색 순위와 키워드 검색 순위를 RRF로 합쳐 상위 config.k개 문서를 반환함.
+    점수 = sum(1 / (RRF_K + 순위)). 키워드 검색에서만 나온 문서는 컬렉션에서 id로 가져오고,
+    이때 메타데이터 조건(config.where())에 맞지 않는 문서는 뺌.
+    """
+    scores = {}
+    docs = {}
+    for rank, doc in enumerate(vector_docs):
+        doc_id = doc.id or document_id(doc)
+        docs[doc_id] = doc
+        scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (RRF_K + rank + 1)
+
+    missing = [doc_id for doc_id, _ in keyword_hits if doc_id not in docs]
+    for doc in get_documents(db, missing, where=config.where()):
+        docs[doc.id] = doc
+    for rank, (doc_id, _) in enumerate(keyword_hits):
+        if doc_id in docs:
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (RRF_K + rank + 1)
+
+    top_ids = sorted(scores, key=scores.get, reverse=True)[:config.k]
+    keyword_only = sum(1 for doc_id in top_ids if doc_id in missing)
+    print(f"[디버그] 하이브리드 검색: 임베딩 {len(vector_docs)}개, 키워드 {len(keyword_hits)}개 -> {len(top_ids)}개 "
+          f"(키워드로만 찾은 문서 {keyword_only}개)")
+    return [docs[doc_id] for doc_id in top_ids]
 
 def check_stored_documents(vector_store):
     """ChromaDB에 저장된 문서 개수를 확인하는 함수"""
-    all_data = vector_store.get()
-    print(f"[디버그] 저장된 문서 개수: {len(all_data['ids'])}")
-    print(f"[디버그] 저장된 문서 내용 예시: {all_data['documents'][:3]}")
+    sample = vector_store.get(limit=3, include=["documents"])  # 예시로 볼 3개만 가져옴
+    print(f"[디버그] 저장된 문서 개수: {vector_store._collection.count()}")
+    print(f"[디버그] 저장된 문서 내용 예시: {sample['documents']}")
 
 if __name__ == "__main__":
+    from pdf_processed.processed_documents import load_document_lazy, filter_tegs_lazy
+
     db = create_vector_store(collection_name="document_embeddings", db_path=r"C:\Users\eys63\Desktop\24dot75_my\pdf_processed\chroma_langchain_db")
     
     # 문서 불러오기
     file_path = r"C:\Users\eys63\Desktop\24dot75_my\pdf_processed\data\SPRI_AI.pdf"
     #file_path = "C:/Users/eys63/github/24dot75/pdf_processed/data/25jj수시모집요강.pdf"
-    docs = load_document(file_path=file_path, split="element")
-    print(f"[디버그] 불러온 문서 개수: {len(docs)}")
-    
-    # 문서 추가
-    db = add_documents(db, docs)
+    # 파싱 -> 머리글/꼬리글 제거 -> 저장을 제너레이터로 이어서 문서 전체를 메모리에 올리지 않음
+    docs = filter_tegs_lazy(load_document_lazy(file_path=file_path, split="element"))
+
+    # 문서 추가 (DEFAULT_BATCH_SIZE개씩 읽어서 임베딩/저장함)
+    db = add_documents(db, docs, batch_size=DEFAULT_BATCH_SIZE)
     
     # 저장된 문서 확인
     check_stored_documents(db)
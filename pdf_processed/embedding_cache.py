@@ -0,0 +1,175 @@
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# 임베딩 캐시 DB 경로
+EMBEDDING_CACHE_DB_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "embedding_cache.db"))
+
+class EmbeddingStore:
+    """
+    임베딩 벡터를 SQLite 파일에 저장해 두는 영구 저장소임.
+    키는 (모델 이름, 종류, 텍스트)의 SHA-256 해시이고 값은 float32 바이트임.
+    매개변수:
+      - db_path (str): SQLite 파일 경로임.
+    """
+
+    def __init__(self, db_path=EMBEDDING_CACHE_DB_PATH):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                vector BLOB NOT NULL
+            )
+        ''')
+        self._conn.commit()
+
+    def get_many(self, keys):
+        """키 리스트에 해당하는 벡터를 {키: 벡터} 딕셔너리로 반환함. 없는 키는 빠짐."""
+        found = {}
+        with self._lock:
+            # SQLite 변수 개수 제한을 넘지 않도록 나눠서 조회함
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk)
+                for key, vector in rows:
+                    found[key] = np.frombuffer(vector, dtype=np.float32).tolist()
+        return found
+
+    def put_many(self, items):
+        """(키, 벡터) 리스트를 한 트랜잭션으로 저장함."""
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                                   [(key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in items])
+            self._conn.commit()
+
+class CachedEmbeddings(Embeddings):
+    """
+    임베딩 함수를 감싸서 질문 임베딩과 문서 임베딩을 캐시함.
+    같은 질문(또는 평가 체인이 다시 만든 new_query)이 또 들어오면 임베딩 API를 다시 호출하지 않음.
+    질문은 메모리 LRU 캐시를 먼저 보고, persist_path가 주어지면 SQLite 영구 캐시도 확인함.
+    문서는 내용 해시를 키로 영구 캐시에서 찾고, 없는 것만 임베딩함. (같은 배치 안의 중복도 한 번만 임베딩함)
+    매개변수:
+      - embeddings (Embeddings): 실제 임베딩 함수임. (예: UpstageEmbeddings)
+      - max_queries (int): 메모리에 보관할 질문 임베딩 개수임.
+      - persist_path (str): 영구 캐시 SQLite 파일 경로임. None이면 메모리 캐시만 사용함.
+    """
+
+    def __init__(self, embeddings, max_queries=1024, persist_path=None):
+        self.embeddings = embeddings
+        self.max_queries = max_queries
+        self.store = EmbeddingStore(persist_path) if persist_path else None
+        # 같은 텍스트라도 모델이 다르면 벡터가 다르므로 모델 이름을 키에 포함함
+        self.model = getattr(embeddings, "model", None) or type(embeddings).__name__
+        self.stats = {"query_hits": 0, "query_misses": 0, "document_hits": 0, "document_misses": 0}
+
+        self._queries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _key(self, kind, text):
+        return hashlib.sha256(f"{self.model}\0{kind}\0{text}".encode("utf-8")).hexdigest()
+
+    def _cached_query(self, text):
+        """메모리 -> 영구 캐시 순서로 질문 임베딩을 찾음. 없으면 None을 반환함."""
+        with self._lock:
+            vector = self._queries.get(text)
+            if vector is not None:
+                self._queries.move_to_end(text)
+                self.stats["query_hits"] += 1
+                return vector
+
+        if self.store is not None:
+            key = self._key("query", text)
+            vector = self.store.get_many([key]).get(key)
+            if vector is not None:
+                self._remember_query(text, vector, persist=False)
+                with self._lock:
+                    self.stats["query_hits"] += 1
+                return vector
+        return None
+
+    def _remember_query(self, text, vector, persist=True):
+        with self._lock:
+            self._queries[text] = vector
+            self._queries.move_to_end(text)
+            while len(self._queries) > self.max_queries:
+                self._queries.popitem(last=False)
+        if persist and self.store is not None:
+            self.store.put_many([(self._key("query", text), vector)])
+
+    def embed_query(self, text):
+        vector = self._cached_query(text)
+        if vector is not None:
+            return list(vector)
+        with self._lock:
+            self.stats["query_misses"] += 1
+        vector = self.embeddings.embed_query(text)
+        self._remember_query(text, vector)
+        return list(vector)
+
+    async def _off_loop(self, func, *args):
+        """영구 캐시(SQLite)를 쓰는 작업은 이벤트 루프를 막지 않도록 스레드에서 실행함. 메모리 캐시만 쓰면 바로 실행함."""
+        if self.store is None:
+            return func(*args)
+        return await asyncio.to_thread(func, *args)
+
+    async def aembed_query(self, text):
+        vector = await self._off_loop(self._cached_query, text)
+        if vector is not None:
+            return list(vector)
+        with self._lock:
+            self.stats["query_misses"] += 1
+        vector = await self.embeddings.aembed_query(text)
+        await self._off_loop(self._remember_query, text, vector)
+        return list(vector)
+
+    def _cached_documents(self, texts):
+        """
+        문서 텍스트를 내용 해시로 묶고 영구 캐시에서 찾음.
+        반환값:
+          - (keys, found, missing): 텍스트별 키, 캐시에 있던 {키: 벡터}, 새로 임베딩해야 할 {키: 텍스트}.
+        """
+        keys = [self._key("passage", text) for text in texts]
+        found = self.store.get_many(list(set(keys))) if self.store is not None else {}
+        # 같은 배치 안에서 반복되는 텍스트(머리말, 표의 반복 행 등)도 한 번만 임베딩함
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing.setdefault(key, text)
+        with self._lock:
+            self.stats["document_hits"] += len(texts) - len(missing)
+            self.stats["document_misses"] += len(missing)
+        return keys, found, missing
+
+    def _store_documents(self, found, missing, vectors):
+        new_items = list(zip(missing.keys(), vectors))
+        found.update(new_items)
+        if self.store is not None and new_items:
+            self.store.put_many(new_items)
+
+    def embed_documents(self, texts):
+        keys, found, missing = self._cached_documents(texts)
+        if missing:
+            self._store_documents(found, missing, self.embeddings.embed_documents(list(missing.values())))
+        return [list(found[key]) for key in keys]
+
+    async def aembed_documents(self, texts):
+        keys, found, missing = await self._off_loop(self._cached_documents, texts)
+        if missing:
+            vectors = await self.embeddings.aembed_documents(list(missing.values()))
+            await self._off_loop(self._store_documents, found, missing, vectors)
+        return [list(found[key]) for key in keys]
+
+    def hit_rate(self):
+        """질문 임베딩 캐시 적중률(0.0 ~ 1.0)을 반환함."""
+        total = self.stats["query_hits"] + self.stats["query_misses"]
+        return self.stats["query_hits"] / total if total else 0.0
@@ -0,0 +1,327 @@
+"""
+PDF 폴더 전체를 벡터 스토어와 동기화하는 일괄 적재 스크립트임.
+
+사용법:
+    python -m pdf_processed.ingest pdf_processed/data --workers 4 --batch-size 64
+
+- 여러 PDF를 정해진 개수의 작업자(스레드)로 동시에 파싱함 (UpstageDocumentParseLoader).
+- 머리글/꼬리글을 걸러낸 뒤(filter_tegs) 이웃한 요소를 토큰 예산 안에서 합치고(chunk_elements),
+  정해진 크기로 나눠 임베딩하고 Chroma에 저장함. 모든 단계가 제너레이터로 이어져 있어서
+  파일 전체를 메모리에 올리지 않고 파싱되는 대로 batch_size개씩 저장함.
+- 적재 목록(ingest_manifest.json)에 파일별 크기, mtime, 내용 해시, 청크 id를 기록함.
+  다시 실행하면 새 파일과 바뀐 파일만 처리하고, 삭제되거나 교체된 파일의 청크는 컬렉션에서 지움.
+  (교체된 파일의 예전 청크는 다른 파일이 같은 내용을 적재 중일 수 있으므로 모든 파일이 끝난 뒤에 지움)
+  파일 하나가 끝날 때마다 기록하므로, 중간에 실패해도 다시 실행하면 남은 파일부터 이어서 처리함.
+- 청크를 저장할 때 키워드 색인(keyword_index.db)도 함께 갱신함.
+  키워드 색인이 생기기 전에 적재한 컬렉션은 --rebuild-keyword-index로 한 번 색인하면 됨.
+- 끝나면 단계별 처리량(pages/s, chunks/s, embeddings/s)과 청크 크기 분포를 출력함.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+
+from pdf_processed.database_process import create_vector_store, add_documents, delete_documents, document_id, rebuild_keyword_index
+from pdf_processed.processed_documents import load_document_lazy, filter_tegs_lazy, file_sha256
+from pdf_processed.chunking import chunk_elements, ChunkReport
+
+# 기본 경로 설정
+DATA_DIR = os.path.join("pdf_processed", "data")
+CHROMA_DB_PATH = os.path.join("pdf_processed", "chroma_langchain_db")
+COLLECTION_NAME = "document_embeddings"
+
+@dataclass
+class IngestStats:
+    """
+    적재 단계별 처리 개수와 소요 시간(초)을 모아 두는 자료형임.
+    단계: parse(페이지), chunk(필터링/병합 후 청크), embed(임베딩), write(Chroma 저장)
+    """
+    counts: dict = field(default_factory=dict)
+    seconds: dict = field(default_factory=dict)
+    files: int = 0
+    skipped_files: int = 0
+    failed_files: list = field(default_factory=list)
+    started: float = field(default_factory=time.perf_counter)
+    chunks: ChunkReport = field(default_factory=ChunkReport)
+
+    def __post_init__(self):
+        self._lock = threading.Lock()
+
+    def record(self, stage, count, seconds):
+        with self._lock:
+            self.counts[stage] = self.counts.get(stage, 0) + count
+            self.seconds[stage] = self.seconds.get(stage, 0.0) + seconds
+
+    def rate(self, stage):
+        seconds = self.seconds.get(stage, 0.0)
+        return self.counts.get(stage, 0) / seconds if seconds else 0.0
+
+    def report(self):
+        elapsed = time.perf_counter() - self.started
+        print("\n[적재 결과]")
+        print(f"  파일: 처리 {self.files}개, 건너뜀 {self.skipped_files}개, 실패 {len(self.failed_files)}개")
+        print(f"  파싱: {self.counts.get('parse', 0)} pages, {self.rate('parse'):.2f} pages/s (작업자 합산 시간 기준)")
+        print(f"  청크: {self.counts.get('chunk', 0)} chunks, {self.counts.get('chunk', 0) / elapsed if elapsed else 0.0:.2f} chunks/s (전체 시간 기준)")
+        print(f"  임베딩: {self.counts.get('embed', 0)} embeddings, {self.rate('embed'):.2f} embeddings/s")
+        print(f"  저장: {self.counts.get('write', 0)} chunks, {self.rate('write'):.2f} chunks/s")
+        print(f"  삭제: {self.counts.get('delete', 0)} chunks")
+        print(f"  전체 소요 시간: {elapsed:.1f}s")
+        for path, error in self.failed_files:
+            print(f"  [실패] {path}: {error}")
+        if self.chunks.sizes:
+            self.chunks.report()
+
+class Manifest:
+    """
+    어떤 PDF가 컬렉션에 들어 있는지 기록해 두는 JSON 목록임.
+    파일마다 경로, 크기, 수정 시각(mtime), 내용 해시, 저장된 청크 id를 기록함.
+    크기와 mtime이 같으면 해시도 계산하지 않고 그대로 둔 것으로 보며,
+    파일 하나가 끝날 때마다 저장하므로 중간에 실패해도 다시 실행하면 남은 파일부터 이어서 처리함.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.files = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.files = json.load(f).get("files", {})
+
+    def is_unchanged(self, key, size, mtime):
+        entry = self.files.get(key)
+        return entry is not None and entry["size"] == size and entry["mtime"] == mtime
+
+    def update(self, key, size, mtime, sha256, chunk_ids=None):
+        entry = self.files.setdefault(key, {})
+        entry.update({"size": size, "mtime": mtime, "sha256": sha256})
+        if chunk_ids is not None:
+            # 새 버전에 없는 예전 청크 id는 stale_ids에 남겨 두었다가 stale_ids()로 모아서 지움
+            stale = set(entry.get("stale_ids", [])) | set(entry.get("chunk_ids", []))
+            stale.difference_update(chunk_ids)
+            if stale:
+                entry["stale_ids"] = sorted(stale)
+            else:
+                entry.pop("stale_ids", None)
+            entry["chunk_ids"] = chunk_ids
+            entry["ingested_at"] = time.strftime("%Y-%m-%d %H:%M:%S")
+        self.save()
+
+    def remove(self, key):
+        self.files.pop(key, None)
+        self.save()
+
+    def orphaned_ids(self, key, keep=()):
+        """
+        key 파일의 청크 중 지워도 되는 id를 반환함.
+        다른 파일도 같은 id를 쓰고 있으면(source 없이 내용 해시만으로 만든 예전 id 등) 그 청크는 남겨 둠.
+        """
+        in_use = set(keep)
+        for other_key, entry in self.files.items():
+            if other_key != key:
+                in_use.update(entry.get("chunk_ids", []))
+        entry = self.files.get(key, {})
+        ids = dict.fromkeys(entry.get("chunk_ids", []) + entry.get("stale_ids", []))
+        return [chunk_id for chunk_id in ids if chunk_id not in in_use]
+
+    def stale_ids(self):
+        """교체된 파일의 예전 청크 id 중 지금 어느 파일에서도 쓰지 않는 것을 반환함."""
+        in_use = set()
+        stale = {}
+        for entry in self.files.values():
+            in_use.update(entry.get("chunk_ids", []))
+            stale.update(dict.fromkeys(entry.get("stale_ids", [])))
+        return [chunk_id for chunk_id in stale if chunk_id not in in_use]
+
+    def clear_stale(self):
+        """예전 청크를 지운 뒤 stale_ids 기록을 비움."""
+        changed = False
+        for entry in self.files.values():
+            changed = entry.pop("stale_ids", None) is not None or changed
+        if changed:
+            self.save()
+
+    def save(self):
+        # 쓰는 도중에 중단되어도 기존 목록이 깨지지 않도록 임시 파일에 쓴 뒤 바꿔치기함
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"files": self.files}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+def find_pdfs(directory):
+    """폴더 아래의 PDF 파일 경로를 정렬해서 반환함."""
+    paths = []
+    for root, _, names in os.walk(directory):
+        paths.extend(os.path.join(root, name) for name in names if name.lower().endswith(".pdf"))
+    return sorted(paths)
+
+def iter_file_documents(path, key, sha256, split, stats, max_tokens=400, overlap_tokens=50):
+    """
+    PDF 하나를 파싱하고 머리글/꼬리글을 걸러낸 문서를 하나씩 돌려줌.
+    split="element"이고 max_tokens가 0보다 크면 이웃한 요소를 합쳐 청크로 만듦.
+    각 문서에 원본 파일 정보(source, file_hash)를 metadata로 붙임.
+    load_document_lazy -> filter_tegs_lazy -> chunk_elements가 모두 제너레이터이므로,
+    add_documents가 batch_size개씩 읽어 가는 만큼만 파싱 결과가 메모리에 올라옴.
+    파싱 시간(parse)은 다음 문서를 꺼내는 데 걸린 시간만 합산함. (임베딩/저장 시간은 빠짐)
+    """
+    pages = set()
+
+    def count_pages(docs):
+        for doc in docs:
+            pages.add(doc.metadata.get("page"))
+            yield doc
+
+    docs = filter_tegs_lazy(count_pages(load_document_lazy(file_path=path, split=split, file_hash=sha256)))
+    if split == "element" and max_tokens:
+        docs = chunk_elements(docs, max_tokens=max_tokens, overlap_tokens=overlap_tokens, report=stats.chunks)
+
+    iterator = iter(docs)
+    parse_seconds = 0.0
+    count = 0
+    while True:
+        started = time.perf_counter()
+        try:
+            doc = next(iterator)
+        except StopIteration:
+            break
+        finally:
+            parse_seconds += time.perf_counter() - started
+        doc.metadata["source"] = key
+        doc.metadata["file_hash"] = sha256
+        count += 1
+        yield doc
+    stats.record("parse", len(pages) if split != "none" else 1, parse_seconds)
+    stats.record("chunk", count, 0.0)
+
+def ingest_file(vector_store, path, key, sha256, split, stats, batch_size=64, max_tokens=400, overlap_tokens=50):
+    """
+    PDF 하나를 파싱하면서 batch_size개씩 바로 임베딩하고 저장함. 작업자 스레드에서 실행됨.
+    파일 전체를 리스트로 모으지 않으므로, 작업자마다 메모리에는 한 배치와 청크 id만 남음.
+    반환값:
+      - 이 파일의 청크 id 리스트. (중복 제거, 처음 나온 순서)
+    """
+    chunk_ids = []
+
+    def remember_ids(docs):
+        for doc in docs:
+            chunk_ids.append(document_id(doc))
+            yield doc
+
+    add_documents(vector_store, remember_ids(iter_file_documents(path, key, sha256, split, stats,
+                                                                 max_tokens, overlap_tokens)),
+                  batch_size=batch_size, stats=stats)
+    return list(dict.fromkeys(chunk_ids))
+
+def ingest_directory(directory=DATA_DIR, db_path=CHROMA_DB_PATH, collection_name=COLLECTION_NAME,
+                     workers=4, batch_size=64, split="element", manifest_path=None,
+                     max_tokens=400, overlap_tokens=50):
+    """
+    폴더와 컬렉션을 동기화함.
+    새 파일과 내용이 바뀐 파일만 파싱/임베딩하고, 삭제되거나 교체된 파일의 청크는 컬렉션에서 지움.
+    매개변수:
+      - directory (str): PDF가 들어 있는 폴더임.
+      - db_path (str): Chroma 저장 경로임.
+      - collection_name (str): 컬렉션 이름임.
+      - workers (int): 동시에 파싱할 파일 수임.
+      - batch_size (int): 한 번에 임베딩하고 저장할 문서 개수임.
+      - split (str): Upstage 파서의 분할 단위임.
+      - manifest_path (str): 적재 목록 파일 경로임. None이면 db_path 안에 만듦.
+      - max_tokens (int): 요소를 합친 청크 하나의 최대 토큰 수임. 0이면 요소를 합치지 않음.
+      - overlap_tokens (int): 이웃한 청크가 겹치는 최대 토큰 수임.
+    반환값:
+      - IngestStats: 단계별 처리량.
+    """
+    stats = IngestStats()
+    vector_store = create_vector_store(collection_name=collection_name, db_path=db_path)
+    manifest = Manifest(manifest_path or os.path.join(db_path, "ingest_manifest.json"))
+
+    # 크기/mtime이 그대로인 파일은 해시도 계산하지 않고 건너뜀
+    pending = []
+    present = set()
+    for path in find_pdfs(directory):
+        key = os.path.relpath(path, directory).replace(os.sep, "/")
+        present.add(key)
+        info = os.stat(path)
+        if manifest.is_unchanged(key, info.st_size, info.st_mtime):
+            stats.skipped_files += 1
+            continue
+        sha256 = file_sha256(path)
+        if manifest.files.get(key, {}).get("sha256") == sha256:
+            # 내용은 그대로이고 mtime만 바뀐 경우
+            manifest.update(key, info.st_size, info.st_mtime, sha256)
+            stats.skipped_files += 1
+            continue
+        pending.append((path, key, sha256, info.st_size, info.st_mtime))
+
+    # 폴더에서 사라진 파일의 청크를 지움
+    for key in [key for key in manifest.files if key not in present]:
+        removed = manifest.orphaned_ids(key)
+        delete_documents(vector_store, removed)
+        manifest.remove(key)
+        stats.record("delete", len(removed), 0.0)
+        print(f"[디버그] 삭제된 파일 정리: {key} (청크 {len(removed)}개 삭제)")
+
+    print(f"[디버그] 적재할 파일 {len(pending)}개, 변경 없는 파일 {stats.skipped_files}개")
+
+    # 작업자마다 파일 하나를 파싱하면서 batch_size개씩 바로 임베딩/저장함
+    # 파싱 결과를 파일 단위로 모아 두지 않으므로, 메모리에는 작업자 수만큼의 배치만 남음
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+        for path, key, sha256, size, mtime in pending:
+            future = executor.submit(ingest_file, vector_store, path, key, sha256, split, stats,
+                                     batch_size, max_tokens, overlap_tokens)
+            futures[future] = (key, sha256, size, mtime)
+
+        for future in as_completed(futures):
+            key, sha256, size, mtime = futures[future]
+            try:
+                chunk_ids = future.result()
+                # 새 버전에 없는 예전 청크는 stale_ids로 남겨 두고, 다른 파일이 아직 적재 중일 수 있으므로 모두 끝난 뒤에 지움
+                manifest.update(key, size, mtime, sha256, chunk_ids)
+                stats.files += 1
+                print(f"[디버그] 적재 완료: {key} ({len(chunk_ids)}개 청크)")
+            except Exception as e:
+                # 실패한 파일은 목록을 갱신하지 않으므로 다음 실행 때 다시 시도함
+                stats.failed_files.append((key, repr(e)))
+                print(f"[오류] 적재 실패: {key}: {e!r}")
+
+    # 교체된 파일의 예전 청크 중 어느 파일에서도 쓰지 않는 것을 지움 (지난 실행에서 남은 것도 포함함)
+    replaced = manifest.stale_ids()
+    if replaced:
+        delete_documents(vector_store, replaced)
+        stats.record("delete", len(replaced), 0.0)
+        print(f"[디버그] 교체된 파일의 예전 청크 {len(replaced)}개 삭제")
+    manifest.clear_stale()
+
+    stats.report()
+    return stats
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="PDF 폴더를 벡터 스토어에 일괄 적재함")
+    parser.add_argument("directory", nargs="?", default=DATA_DIR, help="PDF가 들어 있는 폴더")
+    parser.add_argument("--db-path", default=CHROMA_DB_PATH, help="Chroma 저장 경로")
+    parser.add_argument("--collection", default=COLLECTION_NAME, help="컬렉션 이름")
+    parser.add_argument("--workers", type=int, default=4, help="동시에 파싱할 파일 수")
+    parser.add_argument("--batch-size", type=int, default=64, help="한 번에 임베딩/저장할 문서 수")
+    parser.add_argument("--split", default="element", choices=["none", "page", "element"], help="파서 분할 단위")
+    parser.add_argument("--manifest", default=None, help="적재 목록 파일 경로")
+    parser.add_argument("--max-tokens", type=int, default=400, help="청크 하나의 최대 토큰 수 (0이면 요소를 합치지 않음)")
+    parser.add_argument("--overlap-tokens", type=int, default=50, help="이웃한 청크가 겹치는 최대 토큰 수")
+    parser.add_argument("--rebuild-keyword-index", action="store_true",
+                        help="적재하지 않고, 이미 저장된 문서로 키워드 색인만 다시 만듦")
+    args = parser.parse_args(argv)
+
+    if args.rebuild_keyword_index:
+        rebuild_keyword_index(create_vector_store(collection_name=args.collection, db_path=args.db_path))
+        return 0
+
+    stats = ingest_directory(args.directory, db_path=args.db_path, collection_name=args.collection,
+                             workers=args.workers, batch_size=args.batch_size, split=args.split,
+                             manifest_path=args.manifest, max_tokens=args.max_tokens,
+                             overlap_tokens=args.overlap_tokens)
+    return 1 if stats.failed_files else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
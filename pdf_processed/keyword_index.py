@@ -0,0 +1,124 @@
+import html
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+
+_TAG = re.compile(r"<[^>]+>")
+_WORD = re.compile(r"[0-9a-z가-힣]+")
+_HANGUL_RUN = re.compile(r"[가-힣]{2,}")
+_ASCII_RUN = re.compile(r"[0-9a-z]+")
+
+def html_to_text(text):
+    """
+    Upstage가 output_format="html"로 돌려준 내용에서 태그를 지우고 HTML 엔티티를 풀어 일반 텍스트로 만듦.
+    예: "<p>수강신청&amp;정정</p>" -> "수강신청&정정"
+    """
+    text = _TAG.sub(" ", text or "")
+    return " ".join(html.unescape(text).split())
+
+def tokenize(text):
+    """
+    한국어 검색용 토큰 리스트를 만듦.
+    띄어쓰기 단위 단어, 단어 안의 영문/숫자 부분, 한글 두 글자씩(bigram)을 함께 씀.
+    조사가 붙은 단어("수강신청은")도 bigram("수강", "신청")으로 찾을 수 있고,
+    과목 코드("CSE1010")나 날짜("9월 13일")의 숫자도 그대로 찾을 수 있음.
+    """
+    text = unicodedata.normalize("NFKC", html_to_text(text)).lower()
+    tokens = []
+    for word in _WORD.findall(text):
+        tokens.append(word)
+        parts = _ASCII_RUN.findall(word)
+        if parts != [word]:
+            tokens.extend(parts)
+        for run in _HANGUL_RUN.findall(word):
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+class KeywordIndex:
+    """
+    Chroma 컬렉션과 함께 쓰는 SQLite FTS5 키워드 색인임.
+    문서를 tokenize()로 나눈 토큰을 저장해 두고, 질문 토큰과 BM25 점수로 순위를 매김.
+    임베딩을 거치지 않으므로 과목 코드, 날짜 같은 정확한 단어 검색에 강함.
+    매개변수:
+      - db_path (str): 색인 SQLite 파일 경로임. (보통 Chroma 저장 폴더 안의 keyword_index.db)
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS keyword_chunks (
+                rowid INTEGER PRIMARY KEY,
+                collection TEXT NOT NULL,
+                chunk_id TEXT NOT NULL,
+                UNIQUE (collection, chunk_id)
+            )
+        ''')
+        # 토큰은 tokenize()로 미리 나눠서 공백으로 이어 저장하므로, FTS5는 공백 기준으로만 나누면 됨
+        self._conn.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS keyword_fts
+            USING fts5(terms, tokenize = "unicode61 remove_diacritics 0")
+        ''')
+        self._conn.commit()
+
+    def add(self, collection, ids, texts):
+        """문서 id와 내용을 색인에 추가함. 이미 있는 id는 새 내용으로 바꿈."""
+        with self._lock:
+            self._delete(collection, ids)
+            for chunk_id, text in zip(ids, texts):
+                cursor = self._conn.execute("INSERT INTO keyword_chunks (collection, chunk_id) VALUES (?, ?)",
+                                            (collection, chunk_id))
+                self._conn.execute("INSERT INTO keyword_fts (rowid, terms) VALUES (?, ?)",
+                                   (cursor.lastrowid, " ".join(tokenize(text))))
+            self._conn.commit()
+
+    def delete(self, collection, ids):
+        """문서 id에 해당하는 항목을 색인에서 지움."""
+        with self._lock:
+            self._delete(collection, ids)
+            self._conn.commit()
+
+    def _delete(self, collection, ids):
+        ids = list(ids)
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            rows = self._conn.execute(
+                f"SELECT rowid FROM keyword_chunks WHERE collection = ? AND chunk_id IN ({placeholders})",
+                [collection, *chunk]).fetchall()
+            self._conn.executemany("DELETE FROM keyword_fts WHERE rowid = ?", rows)
+            self._conn.executemany("DELETE FROM keyword_chunks WHERE rowid = ?", rows)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def count(self, collection):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM keyword_chunks WHERE collection = ?",
+                                      (collection,)).fetchone()[0]
+
+    def search(self, collection, query, k=10):
+        """
+        질문과 겹치는 토큰이 많은 문서를 BM25 순서로 찾음.
+        반환값:
+          - [(문서 id, 점수), ...] 리스트. 점수는 클수록 관련이 높음.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        # 토큰을 큰따옴표로 감싸서 FTS5 문법 문자로 해석되지 않도록 함
+        match = " OR ".join('"' + term.replace('"', '') + '"' for term in terms)
+        with self._lock:
+            rows = self._conn.execute('''
+                SELECT c.chunk_id, bm25(keyword_fts) AS score
+                FROM keyword_fts JOIN keyword_chunks c ON c.rowid = keyword_fts.rowid
+                WHERE keyword_fts MATCH ? AND c.collection = ?
+                ORDER BY score LIMIT ?
+            ''', (match, collection, k)).fetchall()
+        # FTS5의 bm25()는 작을수록 관련이 높으므로 부호를 바꿈
+        return [(chunk_id, -score) for chunk_id, score in rows]
@@ -1,15 +1,23 @@
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_openai import ChatOpenAI
-from langchain_teddynote.messages import stream_response
 from langchain_core.output_parsers import JsonOutputParser
+from langchain_core.callbacks import UsageMetadataCallbackHandler
 
 from datetime import datetime
+from dataclasses import dataclass, field, replace
 from pydantic import BaseModel, Field
 
 #from database_process import select_docs
-from pdf_processed.database_process import select_docs
+from pdf_processed.database_process import select_docs, aselect_docs, collection_name, get_documents, stored_embeddings, DEFAULT_SEARCH
+from pdf_processed.answer_cache import get_answer_cache
+from pdf_processed.rerank import LexicalVectorReranker
+from pdf_processed.context_builder import build_context, DEFAULT_CONTEXT_TOKENS
+from pdf_processed.conversation import Conversation, create_conversation_chains, DEFAULT_HISTORY_TURNS
 import sys
 import os
+import asyncio
+import threading
+import time
+import numpy as np
 
 # 현재 작업 디렉토리 기준으로 pdf_processed 경로 추가
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "pdf_processed")))
@@ -64,11 +72,15 @@ def question_output_parser():
 
     return parser
 
+def current_time():
+  """프롬프트에 넣을 현재 시각 문자열을 반환함."""
+  return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
 def define_prompts(answer_parser, question_parser):
 
   answer_prompt = ChatPromptTemplate.from_messages([
-    ("system", f"""
-            [{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}]
+    ("system", """
+            [{current_time}]
             # Query and Documentation Analysis Guidelines
 
             ## Step 1: Query and Document Analysis
@@ -104,7 +116,7 @@ def define_prompts(answer_parser, question_parser):
     ])
 
   question_prompt = ChatPromptTemplate.from_messages([
-  ("system", f"""[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}]
+  ("system", """[{current_time}]
   You are tasked with evaluating the quality of an answer provided by an LLM based on a given question and relevant documentation. Follow these steps to ensure the evaluation is accurate, consistent, and complete:
 
   1. **Evaluate the answer for completeness and appropriateness**:
@@ -153,11 +165,35 @@ def define_prompts(answer_parser, question_parser):
   ])
 
   # Partial Prompts with Formatting Instructions
-  answer_prompt = answer_prompt.partial(format_instructions=answer_parser.get_format_instructions())
-  question_prompt = question_prompt.partial(format_instructions=question_parser.get_format_instructions())
+  # current_time은 함수로 넘겨서 프롬프트를 한 번만 만들어도 호출할 때마다 현재 시각이 들어가도록 함.
+  answer_prompt = answer_prompt.partial(format_instructions=answer_parser.get_format_instructions(),
+                                        current_time=current_time)
+  question_prompt = question_prompt.partial(format_instructions=question_parser.get_format_instructions(),
+                                            current_time=current_time)
 
   return answer_prompt, question_prompt
 
+def define_compact_evaluation_prompt(question_parser):
+  """
+  짧은 평가용 프롬프트임. 문서 본문과 전체 답변 대신 출처 목록(문서 번호/쪽)과 결론만 보고 평가함.
+  검색 신뢰도가 어느 정도 높을 때 전체 평가 대신 사용함.
+  """
+  compact_prompt = ChatPromptTemplate.from_messages([
+  ("system", """[{current_time}]
+  Evaluate whether the conclusion of an LLM answer fully and correctly answers the question, using only the cited sources listed.
+  - Return `next: true` only if the conclusion directly answers the question and is supported by the cited sources.
+  - Otherwise return `next: false`, and rewrite the question in simple Korean as `new_query` so that a new search can find better documents.
+  - `score` is between 0.0 and 1.0.
+  - Write `reason` in one short Korean sentence.
+  {format_instructions}
+    """),
+  ("human", """instruction : {instruction},
+                sources : {citations},
+                conclusion : {conclusion}"""),
+  ])
+  return compact_prompt.partial(format_instructions=question_parser.get_format_instructions(),
+                                current_time=current_time)
+
   # 체인 생성 함수
 def create_chains(llm, answer_prompt, question_prompt, answer_parser, question_parser):
   answer_chain = answer_prompt | llm | answer_parser
@@ -165,44 +201,848 @@ def create_chains(llm, answer_prompt, question_prompt, answer_parser, question_p
   return answer_chain, question_chain
 
 # 쿼리 실행 및 결과 반환 함수
-def execute_chains(answer_chain, question_chain, query, mmr_docs):
+def execute_chains(answer_chain, question_chain, query, mmr_docs, timings=None):
+  # 문서 리스트가 들어오면 짧은 문맥 문자열로 바꿔서 두 체인에 같은 문자열을 넣음
+  if not isinstance(mmr_docs, str):
+    mmr_docs = build_context(mmr_docs)
+
   # Answer Chain Execution
+  started = time.perf_counter()
   answer_q = {"instruction": query, "mmr_docs": mmr_docs}
   answer = answer_chain.invoke(answer_q)
+  answered = time.perf_counter()
 
   # Question Chain Execution
   question_q = {"instruction": query, "mmr_docs": mmr_docs, "llm_answer": answer}
   question = question_chain.invoke(question_q)
 
+  # 단계별 소요 시간(초)을 기록함
+  if timings is not None:
+    timings["answer"] = answered - started
+    timings["evaluation"] = time.perf_counter() - answered
+
   return answer, question
 
-# Main 함수
-def generate_response(db, query):
-  
-  answer_parser = answer_output_parser()
-  question_parser = question_output_parser()
-
-  # Define Prompts
-  answer_prompt, question_prompt = define_prompts(answer_parser, question_parser)
-
-  # Initialize LLM
-  llm = ChatOpenAI(temperature=0, model_name="gpt-4o-mini")
-
-  # Create Chains
-  answer_chain, question_chain = create_chains(llm, answer_prompt, question_prompt, answer_parser, question_parser)
-
-  for i in range(10):
-    mmr_docs = select_docs(db, query)
-
-    # Execute Chains and Get Results
-    answer, question = execute_chains(answer_chain, question_chain, query, mmr_docs)
-    print(f"[디버그] {i}번째 시도 결과: {answer}")
-    print(f"[디버그] {i}번째 시도 결과: {question}")
-    
-    if question["next"]:
-      break
-    else:
+def evaluation_score(question):
+  """
+  평가 결과에서 점수를 꺼냄. 파서 필드 이름은 'scroe'이지만 프롬프트 예시는 'score'이므로 둘 다 확인함.
+  점수가 없거나 숫자가 아니면 0.0을 반환함.
+  """
+  score = question.get("scroe", question.get("score"))
+  try:
+    return float(score)
+  except (TypeError, ValueError):
+    return 0.0
+
+@dataclass
+class RefinementPolicy:
+  """
+  답변 보완(재검색 + 재생성) 반복을 언제 멈출지 정하는 설정임.
+    - max_rounds (int): 최대 시도 횟수임.
+    - deadline_seconds (float): 전체 제한 시간(초)임. None이면 제한하지 않음.
+      지금까지의 평균 시도 시간으로 보아 다음 시도가 제한 시간을 넘길 것 같으면 시작하지 않음.
+    - score_threshold (float): 평가 점수가 이 값 이상이면 'next'가 False여도 멈춤. None이면 사용하지 않음.
+  """
+  max_rounds: int = 10
+  deadline_seconds: float = None
+  score_threshold: float = None
+
+@dataclass
+class EvaluationPolicy:
+  """
+  답변 평가를 얼마나 크게 할지 정하는 설정임.
+  검색 신뢰도(질문과 가장 가까운 검색 문서의 임베딩 코사인 유사도)에 따라 평가 방법을 고름.
+    - skip_threshold (float): 신뢰도가 이 값 이상이면 LLM 평가를 생략하고 통과로 봄. None이면 생략하지 않음.
+    - compact_threshold (float): 신뢰도가 이 값 이상이면 출처 목록과 결론만 보는 짧은 평가를 씀. None이면 항상 전체 평가를 씀.
+    - full_on_failure (bool): 짧은 평가를 통과하지 못하면 전체 평가로 다시 확인함.
+  신뢰도 값의 범위는 임베딩 모델마다 다르므로, EvaluationStats에 쌓인 기록을 보고 조정함.
+  """
+  skip_threshold: float = 0.8
+  compact_threshold: float = 0.6
+  full_on_failure: bool = True
+
+class EvaluationStats:
+  """
+  평가 방법별(skip, compact, full) 사용 횟수와 LLM 호출 수, 토큰 수를 모아 두는 객체임.
+  비교할 수 있도록 답변 체인(answer)도 함께 기록함. 여러 스레드에서 함께 써도 됨.
+  """
+
+  MODES = ("answer", "skip", "compact", "full")
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self.counts = {mode: {"uses": 0, "llm_calls": 0, "input_tokens": 0, "output_tokens": 0} for mode in self.MODES}
+
+  def record(self, mode, llm_calls=0, usage=None):
+    """
+    매개변수:
+      - mode (str): "answer", "skip", "compact", "full" 중 하나임.
+      - llm_calls (int): LLM 호출 횟수임.
+      - usage (dict): UsageMetadataCallbackHandler.usage_metadata ({모델 이름: {"input_tokens", "output_tokens", ...}})
+    """
+    with self._lock:
+      entry = self.counts[mode]
+      entry["uses"] += 1
+      entry["llm_calls"] += llm_calls
+      for model_usage in (usage or {}).values():
+        entry["input_tokens"] += model_usage.get("input_tokens", 0)
+        entry["output_tokens"] += model_usage.get("output_tokens", 0)
+
+  def report(self):
+    """평가 방법별 기록을 한 줄씩 출력함."""
+    with self._lock:
+      for mode, entry in self.counts.items():
+        print(f"[디버그] {mode}: {entry['uses']}회, LLM 호출 {entry['llm_calls']}회, "
+              f"입력 {entry['input_tokens']} 토큰, 출력 {entry['output_tokens']} 토큰")
+
+def retrieval_confidence(db, query, docs):
+  """
+  질문 임베딩과 검색 문서 임베딩의 코사인 유사도 중 가장 큰 값을 반환함. 문서가 없으면 0.0을 반환함.
+  문서 임베딩은 컬렉션에 저장된 벡터를 id로 읽어 오고 다시 임베딩하지 않음. (저장된 벡터가 없는 문서는 빼고 계산함)
+  질문 임베딩은 검색할 때 CachedEmbeddings에 캐시된 것을 씀.
+  """
+  if not docs or db is None:
+    return 0.0
+  vectors = [vector for vector in stored_embeddings(db, docs) if vector is not None]
+  if not vectors:
+    return 0.0
+  query_vector = np.asarray(db.embeddings.embed_query(query), dtype=np.float32)
+  doc_vectors = np.asarray(vectors, dtype=np.float32)
+  norms = np.linalg.norm(doc_vectors, axis=1) * (np.linalg.norm(query_vector) or 1.0)
+  return float(np.max(doc_vectors @ query_vector / np.where(norms == 0, 1.0, norms)))
+
+def _compact_inputs(query, context, answer):
+  """짧은 평가에 넣을 값(질문, 출처 목록, 결론)을 만듦."""
+  citations = [line for line in context.splitlines() if line.startswith("[") and "] " in line]
+  cited = (answer.get("answer") or {}).get("metadata") or []
+  conclusion = (answer.get("conclusion") or {}).get("conclusion") or ""
+  return {"instruction": query, "citations": "\n".join(citations + [str(item) for item in cited]),
+          "conclusion": conclusion}
+
+@dataclass
+class RoundStat:
+  """
+  보완 반복 한 번의 소요 시간(초)과 평가 점수임.
+  """
+  round: int
+  query: str
+  retrieval_seconds: float
+  answer_seconds: float
+  evaluation_seconds: float
+  score: float
+  passed: bool
+  rerank_seconds: float = 0.0
+  evaluator: str = "full"
+
+  @property
+  def total_seconds(self):
+    return self.retrieval_seconds + self.rerank_seconds + self.answer_seconds + self.evaluation_seconds
+
+@dataclass
+class RAGResult:
+  """
+  generate_response 한 번의 결과를 담는 자료형임.
+    - answer (dict): 답변 체인의 결과임.
+    - evaluation (dict): 평가 체인의 결과임.
+    - query (str): 반환한 답변을 만들 때 사용한 질문임.
+    - docs (List[Document]): 반환한 답변을 만들 때 사용한 검색 문서임. 화면 표시나 로그에 그대로 쓸 수 있음.
+    - rounds (List[RoundStat]): 시도별 소요 시간과 점수임.
+    - stop_reason (str): 반복을 멈춘 이유임. ('passed', 'score_threshold', 'max_rounds', 'deadline', 'no_new_query')
+    - cache_version (int): 답변 캐시를 조회할 때 본 컬렉션 버전임. 답변을 캐시에 저장할 때 이 버전으로 저장함.
+  """
+  answer: dict
+  evaluation: dict
+  query: str
+  docs: list = field(default_factory=list)
+  rounds: list = field(default_factory=list)
+  stop_reason: str = "passed"
+  cache_version: int = None
+
+  @property
+  def score(self):
+    return evaluation_score(self.evaluation)
+
+def render_answer_markdown(answer):
+  """
+  답변 딕셔너리를 화면에 보여줄 마크다운 문자열로 바꿈.
+  스트리밍 중의 부분 답변도 받을 수 있으며, 필드가 생성되는 순서(요약 -> 주요 내용 -> 결론)대로 이어 붙이므로
+  부분 답변이 커질수록 결과 문자열도 앞부분은 그대로 두고 뒤로만 늘어남.
+  """
+  parts = []
+
+  summary = (answer.get("question_summary") or {}).get("summary")
+  if summary:
+    parts.append(f"**🔎 질문 요약:** {summary}")
+
+  main_content = (answer.get("answer") or {}).get("main_content") or []
+  if main_content:
+    lines = [f"**{idx + 1}.** {content}" for idx, content in enumerate(main_content)]
+    parts.append("### 📌 주요 내용:\n" + "\n\n".join(lines))
+
+  conclusion = (answer.get("conclusion") or {}).get("conclusion")
+  if conclusion:
+    parts.append(f"### 🔍 결론: {conclusion}")
+
+  return "\n\n".join(parts)
+
+class StreamingAnswer:
+  """
+  답변 체인의 부분 결과(JsonOutputParser의 스트리밍 결과)를 마크다운 조각으로 흘려보내는 반복자임.
+  반복이 끝나면 answer에 완성된 답변이 들어 있고, evaluate()로 평가 체인을 실행할 수 있음.
+  스트리밍 중 답변 앞부분이 바뀌면(필드 순서가 다르거나 목록 항목이 중간에서 길어짐) 더 내보내지 않고 diverged가 True가 됨.
+  이때 화면은 markdown(완성된 답변)으로 다시 그리고(st.empty()), 다시 그릴 수 없는 터미널은 missing_text()만 출력함.
+  """
+
+  def __init__(self, engine, query, docs, retrieval_seconds=0.0, rerank_seconds=0.0, cached=None, db=None,
+               cache_version=None):
+    self.engine = engine
+    # 평가 방법을 고를 때 검색 신뢰도 계산에 쓰는 문서 저장소 (저장된 문서 임베딩을 읽음)
+    self.db = db
+    self.query = query
+    self.docs = docs
+    # 답변 캐시에서 찾은 결과(RAGResult)가 있으면 체인을 실행하지 않고 그대로 보여줌
+    self.cached = cached
+    self.answer = cached.answer if cached is not None else None
+    self.evaluation = cached.evaluation if cached is not None else None
+    self.retrieval_seconds = retrieval_seconds
+    self.rerank_seconds = rerank_seconds
+    self.cache_version = cache_version
+    # 답변 체인과 평가 체인에 넣을 문맥 문자열 (캐시된 답변이면 필요 없음)
+    self.context = engine.context(docs) if cached is None else None
+    self.first_token_seconds = None
+    self.answer_seconds = 0.0
+    # 지금까지 내보낸 마크다운
+    self.streamed = ""
+    self.evaluation_seconds = 0.0
+
+  def __iter__(self):
+    if self.cached is not None:
+      self.streamed = render_answer_markdown(self.answer)
+      yield self.streamed
+      return
+
+    started = time.perf_counter()
+    rendered = ""
+    answer = {}
+    usage = UsageMetadataCallbackHandler()
+    answer_q = {"instruction": self.query, "mmr_docs": self.context}
+    for answer in self.engine.answer_chain.stream(answer_q, config={"callbacks": [usage]}):
+      if not isinstance(answer, dict):
+        continue
+      text = render_answer_markdown(answer)
+      # 앞부분이 이미 출력된 내용과 같을 때만 늘어난 부분을 내보냄
+      if len(text) > len(rendered) and text.startswith(rendered):
+        if self.first_token_seconds is None:
+          self.first_token_seconds = time.perf_counter() - started
+        self.streamed = text
+        yield text[len(rendered):]
+        rendered = text
+    # 마지막 조각이 이어 붙일 수 있는 내용이면 마저 내보냄. 앞부분이 바뀌었으면 같은 답변을 두 번 보여주지 않도록
+    # 여기서는 내보내지 않고, 호출한 쪽이 diverged를 보고 완성된 답변으로 다시 그림
+    final = render_answer_markdown(answer) if isinstance(answer, dict) else ""
+    if final and final != rendered:
+      if final.startswith(rendered):
+        self.streamed = final
+        yield final[len(rendered):]
+      else:
+        print("[디버그] 스트리밍 중 답변 앞부분이 바뀜 (완성된 답변으로 다시 그려야 함)")
+      if self.first_token_seconds is None:
+        self.first_token_seconds = time.perf_counter() - started
+    self.answer = answer
+    self.answer_seconds = time.perf_counter() - started
+    self.engine.evaluation_stats.record("answer", 1, usage.usage_metadata)
+
+  @property
+  def markdown(self):
+    """완성된 답변의 마크다운임. 답변을 아직 다 받지 않았으면 지금까지 내보낸 내용임."""
+    return render_answer_markdown(self.answer) if isinstance(self.answer, dict) else self.streamed
+
+  @property
+  def diverged(self):
+    """내보낸 내용이 완성된 답변과 달라서 다시 그려야 하면 True임."""
+    return self.markdown != self.streamed
+
+  def missing_text(self):
+    """
+    내보낸 내용에 빠진 부분을 반환함. 처음 달라진 줄부터 끝까지임. (다시 그릴 수 없는 터미널 출력용)
+    """
+    if not self.diverged:
+      return ""
+    final = self.markdown
+    prefix = os.path.commonprefix([final, self.streamed])
+    return final[prefix.rfind("\n") + 1:]
+
+  def evaluate(self):
+    """
+    완성된 답변으로 평가 체인을 실행함. 답변을 아직 끝까지 받지 않았으면 먼저 모두 받음.
+    반환값:
+      - 평가 결과 딕셔너리.
+    """
+    if self.answer is None:
+      for _ in self:
+        pass
+    started = time.perf_counter()
+    self.evaluation = self.engine.evaluate(self.db, self.query, self.docs, self.context, self.answer)
+    self.evaluation_seconds = time.perf_counter() - started
+    return self.evaluation
+
+  def to_result(self):
+    """
+    스트리밍 결과를 RAGResult로 바꿈. 평가를 아직 하지 않았으면 먼저 평가함.
+    """
+    if self.cached is not None:
+      return self.cached
+    if self.evaluation is None:
+      self.evaluate()
+    score = evaluation_score(self.evaluation)
+    passed = bool(self.evaluation.get("next"))
+    print(f"[디버그] 첫 출력까지 {self.first_token_seconds or 0.0:.2f}s, 답변 완료까지 {self.answer_seconds:.2f}s, "
+          f"평가 {self.evaluation_seconds:.2f}s, 점수 {score:.2f}")
+    stat = RoundStat(round=0, query=self.query, retrieval_seconds=self.retrieval_seconds,
+                     answer_seconds=self.answer_seconds, evaluation_seconds=self.evaluation_seconds,
+                     score=score, passed=passed, rerank_seconds=self.rerank_seconds,
+                     evaluator=self.evaluation.get("evaluator", "full"))
+    return RAGResult(answer=self.answer, evaluation=self.evaluation, query=self.query, docs=self.docs,
+                     rounds=[stat], stop_reason="passed" if passed else "max_rounds",
+                     cache_version=self.cache_version)
+
+def _out_of_time(policy, rounds, started):
+  """지금까지의 평균 시도 시간으로 보아 다음 시도가 제한 시간을 넘길지 확인함. 첫 시도는 항상 허용함."""
+  if not rounds or policy.deadline_seconds is None:
+    return False
+  elapsed = time.perf_counter() - started
+  expected = sum(r.total_seconds for r in rounds) / len(rounds)
+  return elapsed + expected > policy.deadline_seconds
+
+def _round_stat(i, query, timings, answer, question):
+  """시도 한 번의 통계를 만들고 디버그 출력함. timings에는 retrieval, rerank, answer, evaluation 소요 시간이 들어 있음."""
+  stat = RoundStat(round=i, query=query, retrieval_seconds=timings.get("retrieval", 0.0),
+                   answer_seconds=timings["answer"], evaluation_seconds=timings["evaluation"],
+                   score=evaluation_score(question), passed=bool(question.get("next")),
+                   rerank_seconds=timings.get("rerank", 0.0), evaluator=question.get("evaluator", "full"))
+  print(f"[디버그] {i}번째 시도 결과: {answer}")
+  print(f"[디버그] {i}번째 시도 결과: {question}")
+  print(f"[디버그] {i}번째 시도 통계: 점수 {stat.score:.2f}, 검색 {stat.retrieval_seconds:.2f}s, "
+        f"재순위 {stat.rerank_seconds:.2f}s, 답변 {stat.answer_seconds:.2f}s, 평가({stat.evaluator}) {stat.evaluation_seconds:.2f}s")
+  return stat
+
+def _stop_reason(policy, question):
+  """평가 결과를 보고 반복을 멈출 이유를 반환함. 계속해야 하면 None을 반환함."""
+  if question.get("next"):
+    return "passed"
+  if policy.score_threshold is not None and evaluation_score(question) >= policy.score_threshold:
+    return "score_threshold"
+  if not question.get("new_query"):
+    return "no_new_query"
+  return None
+
+def _new_query_ready(question):
+  """
+  스트리밍 중인 평가 결과에서 new_query가 다 만들어졌는지 확인함.
+  new_query 다음 필드(reason)가 나타나기 시작했다면 new_query는 완성된 것임.
+  """
+  return question.get("next") is False and bool(question.get("new_query")) and "reason" in question
+
+def _finish(best, rounds, stop_reason, started):
+  """반환할 결과에 시도 기록과 종료 사유를 붙임."""
+  best.rounds = rounds
+  best.stop_reason = stop_reason
+  print(f"[디버그] 반복 종료: {stop_reason}, {len(rounds)}회, {time.perf_counter() - started:.2f}s")
+  return best
+
+class RAGEngine:
+  """
+  답변 파이프라인(파서, 프롬프트, LLM 클라이언트, 체인)을 한 번만 만들어 두고 재사용하는 객체임.
+  체인과 ChatOpenAI 클라이언트는 호출 사이에 상태를 갖지 않으므로 여러 스레드가 동시에 써도 안전함.
+  질문마다 새로 만드는 것은 검색 결과와 체인 입력값뿐임.
+  매개변수:
+    - model_name (str): 사용할 OpenAI 모델 이름임.
+    - temperature (float): LLM 온도 값임.
+    - policy (RefinementPolicy): 기본 답변 보완 반복 설정임.
+    - cache (AnswerCache): 답변 캐시임. 주어지면 같은/비슷한 질문은 체인을 실행하지 않고 저장된 답변을 반환함.
+    - search (SearchConfig): 문서 검색 설정임. None이면 DEFAULT_SEARCH(하이브리드 + MMR, k=4)를 사용함.
+    - reranker (Reranker): 검색 후보의 순서를 다시 매기는 단계임. 주어지면 후보를 rerank_candidates개 가져와서
+      그중 search.k개를 골라 답변 체인에 넘김. None이면 검색 결과를 그대로 사용함.
+    - rerank_candidates (int): reranker에 넘길 후보 문서 개수임.
+    - context_tokens (int): 프롬프트에 넣을 문서 문맥의 최대 토큰 수임. (build_context 참고)
+    - evaluation (EvaluationPolicy): 평가 방법(생략/짧은 평가/전체 평가)을 고르는 설정임.
+      방법별 LLM 호출 수와 토큰 수는 evaluation_stats에 기록됨.
+  """
+
+  def __init__(self, model_name="gpt-4o-mini", temperature=0, policy=None, cache=None, search=None,
+               reranker=None, rerank_candidates=40, context_tokens=DEFAULT_CONTEXT_TOKENS, evaluation=None):
+    # 답변 보완 반복 설정 (호출할 때 따로 주지 않으면 이 값을 사용함)
+    self.policy = policy or RefinementPolicy()
+
+    # 답변 캐시 (AnswerCache). None이면 캐시를 사용하지 않음
+    self.cache = cache
+
+    # 문서 검색 설정 (SearchConfig)
+    self.search = search or DEFAULT_SEARCH
+
+    # 검색 후보 재순위 단계 (Reranker). None이면 사용하지 않음
+    self.reranker = reranker
+    self.rerank_candidates = rerank_candidates
+
+    # 문서 문맥의 최대 토큰 수
+    self.context_tokens = context_tokens
+
+    # 평가 방법 설정과 방법별 사용 기록
+    self.evaluation = evaluation or EvaluationPolicy()
+    self.evaluation_stats = EvaluationStats()
+
+    # Output Parsers
+    self.answer_parser = answer_output_parser()
+    self.question_parser = question_output_parser()
+
+    # Define Prompts
+    self.answer_prompt, self.question_prompt = define_prompts(self.answer_parser, self.question_parser)
+
+    # Initialize LLM (스트리밍할 때도 토큰 사용량을 받도록 stream_usage를 켬)
+    # langchain_openai(openai 패키지)는 불러오는 데 시간이 걸리므로 엔진을 처음 만들 때 import함
+    from langchain_openai import ChatOpenAI
+    self.llm = ChatOpenAI(temperature=temperature, model_name=model_name, stream_usage=True)
+
+    # Create Chains
+    self.answer_chain, self.question_chain = create_chains(self.llm, self.answer_prompt, self.question_prompt,
+                                                           self.answer_parser, self.question_parser)
+    self.compact_chain = define_compact_evaluation_prompt(self.question_parser) | self.llm | self.question_parser
+
+    # 후속 질문 재작성/대화 요약 체인 (세션마다 만드는 Conversation이 함께 씀)
+    self.condense_chain, self.summary_chain = create_conversation_chains(self.llm)
+
+  def conversation(self, logs=None, max_turns=DEFAULT_HISTORY_TURNS):
+    """
+    사용자 세션 하나의 대화 상태(Conversation)를 만듦.
+    질문마다 conversation.standalone_query()로 바꾼 질문을 retrieve/run/stream에 넘기고,
+    답변이 끝나면 conversation.add_turn()으로 기록함.
+    매개변수:
+      - logs (List[ChatLog]): chat_logs에서 읽은 최신순 대화 기록임. 주어지면 최근 max_turns개로 시작함.
+      - max_turns (int): 그대로 보관할 최근 턴 수임.
+    """
+    conversation = Conversation(self.condense_chain, self.summary_chain, max_turns=max_turns)
+    return conversation.load(logs or [])
+
+  def run(self, db, query, docs=None, policy=None):
+    """
+    질문에 대한 답변을 만들고, 평가 결과가 충분하지 않으면 새 질문으로 다시 시도함.
+    시도 횟수나 제한 시간을 다 쓰면 지금까지 점수가 가장 높은 답변을 반환함.
+    매개변수:
+      - db (Chroma): 문서 저장소 객체임.
+      - query (str): 사용자 질문임.
+      - docs (List[Document]): 미리 검색해 둔 문서 리스트임. 주어지면 첫 번째 시도에서 검색을 생략함.
+      - policy (RefinementPolicy): 반복 설정임. None이면 엔진의 기본 설정을 사용함.
+    반환값:
+      - RAGResult: 답변, 평가 결과, 사용한 문서, 시도별 통계.
+    """
+    cached, embedding, version = self._cached(db, query, docs)
+    if cached is not None:
+      return cached
+
+    original_query = query
+    policy = policy or self.policy
+    started = time.perf_counter()
+    rounds = []
+    best = None
+    stop_reason = "max_rounds"
+
+    mmr_docs = docs
+    for i in range(max(policy.max_rounds, 1)):
+      # 남은 시간 안에 한 번 더 시도할 수 없으면 멈춤 (첫 시도는 항상 실행함)
+      if _out_of_time(policy, rounds, started):
+        stop_reason = "deadline"
+        break
+
+      # 첫 시도에서 이미 검색된 문서가 있으면 다시 검색하지 않음
+      timings = {}
+      if mmr_docs is None:
+        mmr_docs = self.retrieve(db, query, timings=timings)
+
+      # Execute Chains and Get Results (평가는 검색 신뢰도에 따라 생략하거나 짧게 함)
+      context = self.context(mmr_docs)
+      answer_started = time.perf_counter()
+      answer = self._answer(query, context)
+      answered = time.perf_counter()
+      question = self.evaluate(db, query, mmr_docs, context, answer)
+      timings.update(answer=answered - answer_started, evaluation=time.perf_counter() - answered)
+      rounds.append(_round_stat(i, query, timings, answer, question))
+
+      current = RAGResult(answer=answer, evaluation=question, query=query, docs=mmr_docs)
+      if best is None or current.score > best.score:
+        best = current
+
+      reason = _stop_reason(policy, question)
+      if reason is not None:
+        stop_reason = reason
+        if reason != "no_new_query":
+          best = current
+        break
+
       query = question["new_query"]
-      continue
+      mmr_docs = None
+
+    result = _finish(best, rounds, stop_reason, started)
+    result.cache_version = version
+    self._remember(db, original_query, result, embedding)
+    return result
+
+  async def arun(self, db, query, docs=None, policy=None):
+    """
+    run()의 asyncio 버전임. 체인의 ainvoke/astream을 사용하므로 하나의 이벤트 루프에서 여러 질문을 동시에 처리할 수 있음.
+    평가 결과를 스트리밍으로 받다가 new_query가 완성되면, 평가가 끝나기 전에 다음 시도의 검색을 미리 시작함.
+    매개변수와 반환값은 run()과 같음.
+    """
+    # 캐시 조회(질문 임베딩)와 저장은 블로킹 호출이므로 이벤트 루프를 막지 않도록 스레드에서 실행함
+    cached, embedding, version = await asyncio.to_thread(self._cached, db, query, docs)
+    if cached is not None:
+      return cached
+
+    original_query = query
+    policy = policy or self.policy
+    started = time.perf_counter()
+    rounds = []
+    best = None
+    stop_reason = "max_rounds"
+    prefetch = None  # (미리 검색 중인 질문, asyncio.Task)
+
+    mmr_docs = docs
+    try:
+      for i in range(max(policy.max_rounds, 1)):
+        if _out_of_time(policy, rounds, started):
+          stop_reason = "deadline"
+          break
+
+        # 미리 시작해 둔 검색이 이번 질문과 같으면 그 결과를 사용함 (기다린 시간만 검색 시간으로 기록함)
+        timings = {}
+        if mmr_docs is None:
+          if prefetch is not None and prefetch[0] == query:
+            retrieval_started = time.perf_counter()
+            mmr_docs = await prefetch[1]
+            timings["retrieval"] = time.perf_counter() - retrieval_started
+          else:
+            mmr_docs = await self.aretrieve(db, query, timings=timings)
+        if prefetch is not None:
+          prefetch[1].cancel()
+          prefetch = None
+
+        # Answer Chain Execution
+        context = self.context(mmr_docs)
+        answer_started = time.perf_counter()
+        answer = await self._aanswer(query, context)
+        answered = time.perf_counter()
+
+        # Question Chain Execution (new_query가 나오는 대로 다음 검색을 시작함)
+        question = {}
+        async for question in self.astream_evaluation(db, query, mmr_docs, context, answer):
+          if prefetch is None and _new_query_ready(question):
+            new_query = question["new_query"]
+            prefetch = (new_query, asyncio.create_task(self.aretrieve(db, new_query)))
+        timings.update(answer=answered - answer_started, evaluation=time.perf_counter() - answered)
+        rounds.append(_round_stat(i, query, timings, answer, question))
+
+        current = RAGResult(answer=answer, evaluation=question, query=query, docs=mmr_docs)
+        if best is None or current.score > best.score:
+          best = current
+
+        reason = _stop_reason(policy, question)
+        if reason is not None:
+          stop_reason = reason
+          if reason != "no_new_query":
+            best = current
+          break
+
+        query = question["new_query"]
+        mmr_docs = None
+    finally:
+      # 쓰이지 않은 미리 검색은 취소함
+      if prefetch is not None:
+        prefetch[1].cancel()
+
+    result = _finish(best, rounds, stop_reason, started)
+    result.cache_version = version
+    await asyncio.to_thread(self._remember, db, original_query, result, embedding)
+    return result
+
+  def stream(self, db, query, docs=None):
+    """
+    답변을 한 번만 생성하면서 부분 결과를 바로 흘려보냄. 평가는 답변 출력이 끝난 뒤 evaluate()로 실행함.
+    매개변수:
+      - db (Chroma): 문서 저장소 객체임.
+      - query (str): 사용자 질문임.
+      - docs (List[Document]): 미리 검색해 둔 문서 리스트임. None이면 여기서 검색함.
+    반환값:
+      - StreamingAnswer: for 문으로 조각을 받아 출력하는 반복자. (앞부분이 바뀌면 diverged, markdown으로 다시 그림)
+    """
+    cached, _, version = self._cached(db, query, docs)
+    if cached is not None:
+      return StreamingAnswer(self, query, cached.docs, cached=cached)
+
+    timings = {}
+    if docs is None:
+      docs = self.retrieve(db, query, timings=timings)
+    return StreamingAnswer(self, query, docs, retrieval_seconds=timings.get("retrieval", 0.0),
+                           rerank_seconds=timings.get("rerank", 0.0), db=db, cache_version=version)
+
+  def retrieve(self, db, query, timings=None):
+    """
+    질문에 대한 문서를 검색함. reranker가 있으면 후보를 넉넉하게 가져온 뒤 다시 순서를 매겨 search.k개를 고름.
+    매개변수:
+      - db (Chroma): 문서 저장소 객체임.
+      - query (str): 검색할 질문임.
+      - timings (dict): 주어지면 단계별 소요 시간(초)을 "retrieval", "rerank" 키로 기록함.
+    반환값:
+      - 답변 체인에 넘길 문서 리스트.
+    """
+    started = time.perf_counter()
+    if self.reranker is None:
+      docs = select_docs(db, query, self.search)
+      retrieved = reranked = time.perf_counter()
+    else:
+      candidates = select_docs(db, query, self._candidate_search())
+      retrieved = time.perf_counter()
+      docs = self.reranker.rerank(query, candidates, self.search.k, embeddings=db.embeddings, vector_store=db)
+      reranked = time.perf_counter()
+      print(f"[디버그] 재순위: 후보 {len(candidates)}개 -> {len(docs)}개, "
+            f"검색 {retrieved - started:.2f}s, 재순위 {reranked - retrieved:.2f}s")
+    if timings is not None:
+      timings["retrieval"] = retrieved - started
+      timings["rerank"] = reranked - retrieved
+    return docs
+
+  async def aretrieve(self, db, query, timings=None):
+    """
+    retrieve()의 asyncio 버전임. 재순위는 CPU 작업이므로 별도 스레드에서 실행함.
+    """
+    started = time.perf_counter()
+    if self.reranker is None:
+      docs = await aselect_docs(db, query, self.search)
+      retrieved = reranked = time.perf_counter()
+    else:
+      candidates = await aselect_docs(db, query, self._candidate_search())
+      retrieved = time.perf_counter()
+      docs = await asyncio.to_thread(self.reranker.rerank, query, candidates, self.search.k, db.embeddings, db)
+      reranked = time.perf_counter()
+    if timings is not None:
+      timings["retrieval"] = retrieved - started
+      timings["rerank"] = reranked - retrieved
+    return docs
+
+  def _answer(self, query, context):
+    """답변 체인을 실행하고 토큰 사용량을 기록함."""
+    usage = UsageMetadataCallbackHandler()
+    answer = self.answer_chain.invoke({"instruction": query, "mmr_docs": context}, config={"callbacks": [usage]})
+    self.evaluation_stats.record("answer", 1, usage.usage_metadata)
+    return answer
+
+  async def _aanswer(self, query, context):
+    usage = UsageMetadataCallbackHandler()
+    answer = await self.answer_chain.ainvoke({"instruction": query, "mmr_docs": context},
+                                             config={"callbacks": [usage]})
+    self.evaluation_stats.record("answer", 1, usage.usage_metadata)
+    return answer
+
+  def _evaluation_mode(self, db, query, docs):
+    """
+    검색 신뢰도를 계산해서 평가 방법("skip", "compact", "full")을 고름.
+    반환값:
+      - (mode, confidence)
+    """
+    policy = self.evaluation
+    if policy.skip_threshold is None and policy.compact_threshold is None:
+      return "full", None
+    confidence = retrieval_confidence(db, query, docs)
+    if policy.skip_threshold is not None and confidence >= policy.skip_threshold:
+      return "skip", confidence
+    if policy.compact_threshold is not None and confidence >= policy.compact_threshold:
+      return "compact", confidence
+    return "full", confidence
+
+  def _skipped(self, confidence):
+    """평가를 생략할 때 쓰는 평가 결과임. 검색 신뢰도를 점수로 씀."""
+    return {"next": True, "scroe": round(confidence, 3), "new_query": None,
+            "reason": f"검색 신뢰도({confidence:.2f})가 높아 평가를 생략함", "evaluator": "skip"}
+
+  def evaluate(self, db, query, docs, context, answer):
+    """
+    답변을 평가함. 검색 신뢰도가 높으면 생략하고, 중간이면 짧은 평가를 쓰며,
+    짧은 평가를 통과하지 못했거나 신뢰도가 낮을 때만 전체 평가를 실행함.
+    매개변수:
+      - db (Chroma): 검색 신뢰도 계산에 쓸 문서 저장소임. (저장된 문서 임베딩을 읽음)
+      - query (str): 질문임.
+      - docs (List[Document]): 답변에 사용한 문서임.
+      - context (str): 답변 체인에 넣은 문맥 문자열임.
+      - answer (dict): 답변 체인의 결과임.
+    반환값:
+      - 평가 결과 딕셔너리. "evaluator" 키에 사용한 평가 방법이 들어 있음.
+    """
+    mode, confidence = self._evaluation_mode(db, query, docs)
+    if mode == "skip":
+      self.evaluation_stats.record("skip")
+      return self._skipped(confidence)
+
+    if mode == "compact":
+      usage = UsageMetadataCallbackHandler()
+      question = self.compact_chain.invoke(_compact_inputs(query, context, answer), config={"callbacks": [usage]})
+      self.evaluation_stats.record("compact", 1, usage.usage_metadata)
+      if question.get("next") or not self.evaluation.full_on_failure:
+        return dict(question, evaluator="compact")
+
+    usage = UsageMetadataCallbackHandler()
+    question = self.question_chain.invoke({"instruction": query, "mmr_docs": context, "llm_answer": answer},
+                                          config={"callbacks": [usage]})
+    self.evaluation_stats.record("full", 1, usage.usage_metadata)
+    return dict(question, evaluator="full")
+
+  async def astream_evaluation(self, db, query, docs, context, answer):
+    """
+    evaluate()의 asyncio 버전임. 평가 결과를 부분 결과(딕셔너리)로 하나씩 흘려보내므로,
+    new_query가 완성되는 대로 다음 검색을 시작할 수 있음. 마지막으로 흘려보낸 값이 최종 평가 결과임.
+    """
+    mode, confidence = await asyncio.to_thread(self._evaluation_mode, db, query, docs)
+    if mode == "skip":
+      self.evaluation_stats.record("skip")
+      yield self._skipped(confidence)
+      return
+
+    evaluator = "full"
+    chain, inputs = self.question_chain, {"instruction": query, "mmr_docs": context, "llm_answer": answer}
+    if mode == "compact":
+      compact_inputs = _compact_inputs(query, context, answer)
+      usage = UsageMetadataCallbackHandler()
+      if self.evaluation.full_on_failure:
+        # 전체 평가로 넘어갈 수 있으므로 짧은 평가의 new_query로 미리 검색하지 않도록 한 번에 받음
+        question = await self.compact_chain.ainvoke(compact_inputs, config={"callbacks": [usage]})
+        self.evaluation_stats.record("compact", 1, usage.usage_metadata)
+        if question.get("next"):
+          yield dict(question, evaluator="compact")
+          return
+      else:
+        evaluator, chain, inputs = "compact", self.compact_chain, compact_inputs
+
+    usage = UsageMetadataCallbackHandler()
+    question = {}
+    async for question in chain.astream(inputs, config={"callbacks": [usage]}):
+      yield question
+    self.evaluation_stats.record(evaluator, 1, usage.usage_metadata)
+    yield dict(question, evaluator=evaluator)
+
+  def context(self, docs):
+    """검색 문서를 프롬프트에 넣을 문맥 문자열로 만듦."""
+    return build_context(docs, max_tokens=self.context_tokens)
+
+  def _candidate_search(self):
+    """reranker에 넘길 후보를 가져올 검색 설정임. (개수만 rerank_candidates로 늘림)"""
+    k = max(self.rerank_candidates, self.search.k)
+    return replace(self.search, k=k, fetch_k=max(self.search.fetch_k, k))
+
+  def refine(self, db, result, policy=None):
+    """
+    이미 얻은 결과(예: 스트리밍으로 만든 첫 답변)에서 이어서 답변 보완을 진행함.
+    시도 횟수와 제한 시간은 result에 기록된 시도까지 합쳐서 계산함.
+    매개변수:
+      - db (Chroma): 문서 저장소 객체임.
+      - result (RAGResult): 지금까지의 결과임.
+      - policy (RefinementPolicy): 반복 설정임. None이면 엔진의 기본 설정을 사용함.
+    반환값:
+      - RAGResult: 점수가 더 높은 쪽의 결과 (시도 기록은 모두 합쳐짐).
+    """
+    if result.stop_reason == "cache":
+      return result
+    original_query = result.rounds[0].query if result.rounds else result.query
+    result = self._refine(db, result, policy)
+    self._remember(db, original_query, result)
+    return result
+
+  def _refine(self, db, result, policy):
+    policy = policy or self.policy
+    new_query = result.evaluation.get("new_query")
+    if result.rounds and result.rounds[-1].passed:
+      return result
+    if policy.score_threshold is not None and result.score >= policy.score_threshold:
+      result.stop_reason = "score_threshold"
+      return result
+    if not new_query:
+      result.stop_reason = "no_new_query"
+      return result
+
+    # 남은 시도 횟수와 남은 시간으로 새 설정을 만듦
+    spent = sum(r.total_seconds for r in result.rounds)
+    remaining = replace(policy, max_rounds=policy.max_rounds - len(result.rounds))
+    if policy.deadline_seconds is not None:
+      remaining.deadline_seconds = policy.deadline_seconds - spent
+      expected = spent / len(result.rounds) if result.rounds else 0.0
+      if remaining.deadline_seconds < expected:
+        result.stop_reason = "deadline"
+        return result
+    if remaining.max_rounds <= 0:
+      result.stop_reason = "max_rounds"
+      return result
+
+    refined = self.run(db, new_query, policy=remaining)
+    for n, stat in enumerate(refined.rounds, start=len(result.rounds)):
+      stat.round = n
+    rounds = result.rounds + refined.rounds
+    best = refined if refined.score > result.score or refined.stop_reason == "passed" else result
+    best.rounds = rounds
+    best.stop_reason = refined.stop_reason
+    return best
+
+  def _cached(self, db, query, docs=None):
+    """
+    답변 캐시에서 질문을 찾음.
+    반환값:
+      - (result, embedding, version): 캐시에 있으면 RAGResult, 없으면 None과 조회하면서 계산한 질문 임베딩,
+        그리고 조회할 때 본 컬렉션 버전. (답변을 저장할 때 RAGResult.cache_version으로 넘김)
+    """
+    if self.cache is None:
+      return None, None, None
+    cached, embedding, version = self.cache.lookup(collection_name(db), query, db.embeddings.embed_query)
+    if cached is None:
+      return None, embedding, version
+    # 캐시된 답변을 만들 때 쓴 문서를 id로 다시 가져와서 출처를 함께 보여줌
+    result = RAGResult(answer=cached["answer"], evaluation=cached["evaluation"], query=cached["query"],
+                       docs=docs or get_documents(db, cached["doc_ids"]), stop_reason="cache", cache_version=version)
+    return result, embedding, version
+
+  def _remember(self, db, query, result, embedding=None):
+    """평가를 통과한 답변만 답변 캐시에 저장함."""
+    if self.cache is None or result.stop_reason not in ("passed", "score_threshold"):
+      return
+    if embedding is None:
+      embedding = db.embeddings.embed_query(query)
+    self.cache.store(collection_name(db), query, result.answer, result.evaluation, embedding,
+                     doc_ids=[doc.id for doc in result.docs if doc.id], version=result.cache_version)
+
+  def generate_response(self, db, query, docs=None, policy=None):
+    """
+    run()과 같지만 기존 호출 방식대로 (answer, question) 튜플을 반환함.
+    """
+    result = self.run(db, query, docs=docs, policy=policy)
+    return result.answer, result.evaluation
+
+_engine = None
+_engine_lock = threading.Lock()
+
+def get_engine():
+  """
+  프로세스 전체에서 함께 쓰는 RAGEngine을 반환함. 처음 호출할 때 한 번만 생성함.
+  """
+  global _engine
+  if _engine is None:
+    with _engine_lock:
+      if _engine is None:
+        _engine = RAGEngine(cache=get_answer_cache(), reranker=LexicalVectorReranker())
+  return _engine
+
+# Main 함수
+def generate_response(db, query, docs=None, policy=None):
+  """공용 RAGEngine으로 답변을 생성함. 기존 호출 방식과 같은 (answer, question)을 반환함."""
+  return get_engine().generate_response(db, query, docs=docs, policy=policy)
 
-  return answer, question
\ No newline at end of file
+async def agenerate_response(db, query, docs=None, policy=None):
+  """
+  generate_response의 asyncio 버전임. 스레드를 늘리지 않고 한 프로세스에서 여러 사용자의 질문을 동시에 처리할 때 사용함.
+  예: await asyncio.gather(*(agenerate_response(db, q) for q in questions))
+  """
+  result = await get_engine().arun(db, query, docs=docs, policy=policy)
+  return result.answer, result.evaluation
@@ -0,0 +1,61 @@
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+
+from langchain_core.documents import Document
+
+# 파싱 결과 캐시 폴더 경로
+PARSE_CACHE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "parse_cache"))
+
+# 저장 형식이 바뀌면 올려서 예전 캐시를 쓰지 않도록 함
+CACHE_FORMAT_VERSION = 1
+
+class ParseCache:
+    """
+    Upstage 문서 파싱 결과를 디스크에 저장해 두는 캐시임.
+    키는 파일 내용 해시와 파싱 옵션(split, output_format, ocr, coordinates)이고,
+    요소 하나를 JSON 한 줄로 쓴 gzip 압축 파일(.jsonl.gz)로 저장함.
+    읽을 때는 한 줄씩 Document로 만들어 돌려주므로 전체를 메모리에 올리지 않아도 됨.
+    매개변수:
+      - directory (str): 캐시 파일을 저장할 폴더임.
+    """
+
+    def __init__(self, directory=PARSE_CACHE_DIR):
+        self.directory = directory
+
+    def path_for(self, file_hash, split, output_format, ocr, coordinates):
+        """캐시 파일 경로를 반환함."""
+        options = json.dumps([CACHE_FORMAT_VERSION, split, output_format, ocr, coordinates])
+        options_hash = hashlib.sha256(options.encode("utf-8")).hexdigest()[:12]
+        return os.path.join(self.directory, f"{file_hash}-{options_hash}.jsonl.gz")
+
+    def exists(self, path):
+        return os.path.exists(path)
+
+    def iter_documents(self, path):
+        """캐시 파일의 요소를 하나씩 Document로 돌려줌."""
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                item = json.loads(line)
+                yield Document(page_content=item["page_content"], metadata=item["metadata"])
+
+    def write_through(self, path, documents):
+        """
+        documents를 하나씩 그대로 돌려주면서 캐시 파일에 기록함.
+        끝까지 읽었을 때만 캐시 파일이 완성되므로, 중간에 실패해도 깨진 캐시가 남지 않음.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        # 같은 내용의 PDF를 여러 스레드가 동시에 파싱해도 임시 파일이 겹치지 않도록 고유한 이름을 씀
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=os.path.basename(path) + ".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as raw, gzip.open(raw, "wt", encoding="utf-8") as f:
+                for doc in documents:
+                    f.write(json.dumps({"page_content": doc.page_content, "metadata": doc.metadata},
+                                       ensure_ascii=False) + "\n")
+                    yield doc
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
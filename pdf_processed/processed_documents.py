@@ -92,9 +92,11 @@ if __name__ == "__main__":
 from langchain_upstage import UpstageDocumentParseLoader  # 문서를 읽어오는 도구임
 from datetime import datetime  # 현재 시간을 사용하기 위해 가져옴
 from dotenv import load_dotenv  # 환경 변수를 사용하기 위해 가져옴
-from typing import List  # 리스트 타입을 표시할 때 사용함
+from typing import Iterable, Iterator, List  # 리스트/반복자 타입을 표시할 때 사용함
 from collections import namedtuple  # 이름 붙은 튜플(namedtuple)을 사용함
 import os  # 환경 변수를 사용하기 위해 가져옴
+import hashlib  # 파일 해시를 계산하기 위해 가져옴
+from pdf_processed.parse_cache import ParseCache  # 파싱 결과를 디스크에 저장해 두는 캐시임
 
 load_dotenv()
 
@@ -106,22 +108,76 @@ def load_document(file_path: str,
                   split: str = "page",
                   output_format: str = "html",
                   ocr: str = "auto",
-                  coordinates: bool = False) -> List[Document]:
+                  coordinates: bool = False,
+                  cache: bool = True,
+                  file_hash: str = None) -> List[Document]:
     """
     파일 경로에 있는 문서를 읽고, 문서 내용을 Document 자료형의 리스트로 만들어 줌
+    cache가 True이면 파싱 결과를 parse_cache에 저장해 두고, 같은 파일을 같은 옵션으로 다시 읽을 때는 Upstage를 호출하지 않음.
+    file_hash를 주면 파일 해시를 다시 계산하지 않음.
+    """
+    return list(load_document_lazy(file_path, split=split, output_format=output_format, ocr=ocr,
+                                   coordinates=coordinates, cache=cache, file_hash=file_hash))
+
+def load_document_lazy(file_path: str,
+                       split: str = "page",
+                       output_format: str = "html",
+                       ocr: str = "auto",
+                       coordinates: bool = False,
+                       cache: bool = True,
+                       file_hash: str = None) -> Iterator[Document]:
+    """
+    load_document와 같지만 문서를 리스트로 모으지 않고 하나씩 돌려줌 (loader.lazy_load 사용).
+    filter_tegs_lazy, add_documents와 이어 쓰면 수백 쪽짜리 문서도 전체를 메모리에 올리지 않고 적재할 수 있음.
     """
+    if cache:
+        parse_cache = ParseCache()
+        cache_path = parse_cache.path_for(file_hash or file_sha256(file_path), split, output_format, ocr, coordinates)
+        if parse_cache.exists(cache_path):
+            print(f"[디버그] 파싱 캐시 사용: {file_path}")
+            yield from parse_cache.iter_documents(cache_path)
+            return
+
     loader = UpstageDocumentParseLoader(file_path,
                                         split=split,
                                         output_format=output_format,
                                         ocr=ocr,
                                         coordinates=coordinates)
-    docs = loader.load()
-    return docs
+    docs = loader.lazy_load()
+    if cache:
+        docs = parse_cache.write_through(cache_path, docs)
+    yield from docs
+
+def filter_tegs(documents: List[Document]) -> List[Document]:
+    """
+    문서 리스트에서 머리글(header)이나 꼬리글(footer)이 아닌 것들만 골라서 돌려줌
+    """
+    return list(filter_tegs_lazy(documents))
+
+def filter_tegs_lazy(documents: Iterable[Document]) -> Iterator[Document]:
+    """
+    filter_tegs와 같지만 문서를 하나씩 걸러서 돌려줌.
+    """
+    for doc in documents:
+        if doc.metadata.get('category') not in ('header', 'footer'):
+            yield doc
 
-file_path = "C:/Users/eys63/Desktop/24dot75_my/pdf_processed/data/SPRI_AI.pdf"
-#file_path = "pdf_processed/data/25jj수시모집요강.pdf"
+def file_sha256(file_path: str) -> str:
+    """
+    파일 내용의 SHA-256 해시를 반환함. 큰 파일도 메모리에 다 올리지 않도록 1MB씩 읽음.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+# 이 파일이 직접 실행될 때만 예시 문서를 읽어옴 (import할 때는 실행하지 않음)
+if __name__ == "__main__":
+    file_path = "C:/Users/eys63/Desktop/24dot75_my/pdf_processed/data/SPRI_AI.pdf"
+    #file_path = "pdf_processed/data/25jj수시모집요강.pdf"
 
-docs = load_document(file_path=file_path, split="element")
+    docs = load_document(file_path=file_path, split="element")
 
-print(f"[디버그] 로드된 문서 개수: {len(docs)}")
-print(f"[디버그] 첫 번째 문서 내용: {docs[0].page_content[:500] if docs else '문서가 없음'}")
+    print(f"[디버그] 로드된 문서 개수: {len(docs)}")
+    print(f"[디버그] 첫 번째 문서 내용: {docs[0].page_content[:500] if docs else '문서가 없음'}")
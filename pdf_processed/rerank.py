@@ -0,0 +1,142 @@
+import math
+from collections import Counter
+
+import numpy as np
+
+from pdf_processed.keyword_index import tokenize, html_to_text
+from pdf_processed.database_process import stored_embeddings
+
+class Reranker:
+    """
+    검색된 후보 문서의 순서를 다시 매기는 단계의 기본 클래스임.
+    select_docs로 넉넉하게(예: 40개) 가져온 후보 중에서 질문과 가장 관련 있는 k개를 골라
+    답변 체인에 넘기므로, 첫 번째 시도에서 좋은 문서를 받을 가능성이 높아져 보완 반복이 줄어듦.
+    rerank()만 구현하면 RAGEngine(reranker=...)에 넣어 쓸 수 있음.
+    """
+
+    def rerank(self, query, docs, k, embeddings=None, vector_store=None):
+        """
+        매개변수:
+          - query (str): 질문임.
+          - docs (List[Document]): 후보 문서들임.
+          - k (int): 돌려줄 문서 개수임.
+          - embeddings (Embeddings): 백터 스토어의 임베딩 함수임. (필요한 reranker만 사용함)
+          - vector_store (Chroma): 후보를 가져온 백터 스토어임. 저장된 문서 임베딩을 id로 읽을 때 사용함.
+        반환값:
+          - 관련이 높은 순서로 고른 k개 문서 리스트.
+        """
+        raise NotImplementedError
+
+class LexicalVectorReranker(Reranker):
+    """
+    CPU만 쓰는 기본 reranker임. 후보 문서 안에서 계산한 BM25 점수와 임베딩 코사인 유사도를
+    각각 0~1로 맞춘 뒤 가중 평균한 점수를 관련도로 씀.
+    문서 임베딩은 vector_store에 저장된 벡터를 id로 읽어 오므로(적재할 때 이미 임베딩함) 임베딩 API를 다시 호출하지 않음.
+    (vector_store가 없거나 저장된 벡터가 없는 문서만 embed_documents로 임베딩함)
+    관련도 순서로만 자르면 후보 검색(mmr)에서 얻은 다양성이 사라지므로, 임베딩이 있으면 mmr처럼
+    이미 고른 문서와 비슷한 만큼 점수를 깎으면서 k개를 하나씩 고름.
+    매개변수:
+      - vector_weight (float): 임베딩 유사도의 비중임. (나머지는 BM25 비중)
+      - k1, b (float): BM25 매개변수임.
+      - diversity (float): 이미 고른 문서와의 유사도를 빼는 비중(0.0 ~ 1.0)임. 0이면 관련도 순서 그대로 고름.
+    """
+
+    def __init__(self, vector_weight=0.6, k1=1.5, b=0.75, diversity=0.3):
+        self.vector_weight = vector_weight
+        self.k1 = k1
+        self.b = b
+        self.diversity = diversity
+
+    def rerank(self, query, docs, k, embeddings=None, vector_store=None):
+        if len(docs) <= 1:
+            return list(docs)[:k]
+        scores = (1 - self.vector_weight) * _min_max(self._bm25(query, docs))
+        doc_vectors = None
+        if embeddings is not None and self.vector_weight:
+            query_vector = _unit_rows(np.asarray([embeddings.embed_query(query)], dtype=np.float32))[0]
+            doc_vectors = self._doc_vectors(docs, embeddings, vector_store)
+            scores = scores + self.vector_weight * _min_max(doc_vectors @ query_vector)
+        if doc_vectors is None or not self.diversity:
+            order = np.argsort(-scores, kind="stable")[:k]
+        else:
+            order = _diverse_order(scores, doc_vectors, k, self.diversity)
+        return [docs[i] for i in order]
+
+    def _bm25(self, query, docs):
+        """후보 문서들만으로 문서 빈도를 계산한 BM25 점수임."""
+        terms = set(tokenize(query))
+        doc_terms = [Counter(tokenize(doc.page_content)) for doc in docs]
+        lengths = np.array([sum(counts.values()) for counts in doc_terms], dtype=np.float32)
+        average = lengths.mean() or 1.0
+        scores = np.zeros(len(docs), dtype=np.float32)
+        for term in terms:
+            df = sum(1 for counts in doc_terms if term in counts)
+            if not df:
+                continue
+            idf = math.log(1 + (len(docs) - df + 0.5) / (df + 0.5))
+            tf = np.array([counts.get(term, 0) for counts in doc_terms], dtype=np.float32)
+            scores += idf * tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * lengths / average))
+        return scores
+
+    @staticmethod
+    def _doc_vectors(docs, embeddings, vector_store=None):
+        """후보 문서의 임베딩을 단위 벡터 행렬로 반환함. 저장된 벡터가 없는 문서만 새로 임베딩함."""
+        vectors = stored_embeddings(vector_store, docs) if vector_store is not None else [None] * len(docs)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            for i, vector in zip(missing, embeddings.embed_documents([docs[i].page_content for i in missing])):
+                vectors[i] = vector
+        return _unit_rows(np.asarray(vectors, dtype=np.float32))
+
+class CrossEncoderReranker(Reranker):
+    """
+    (질문, 문서) 쌍을 직접 점수 매기는 작은 cross-encoder 모델을 쓰는 reranker임. CPU에서도 동작함.
+    sentence-transformers가 설치되어 있어야 하며, backend="onnx"이면 ONNX Runtime으로 실행함.
+    매개변수:
+      - model_name (str): Hugging Face 모델 이름임. 기본값은 한국어를 포함한 다국어 모델임.
+      - backend (str): "torch" 또는 "onnx"임.
+      - max_chars (int): 문서에서 모델에 넣을 최대 글자 수임.
+    """
+
+    def __init__(self, model_name="cross-encoder/mmarco-mMiniLMv2-L12-H384-v1", backend="torch", max_chars=1000):
+        try:
+            from sentence_transformers import CrossEncoder
+        except ImportError as e:
+            raise ImportError("CrossEncoderReranker를 쓰려면 sentence-transformers를 설치해야 함: "
+                              "pip install sentence-transformers") from e
+        self.model = CrossEncoder(model_name, device="cpu", backend=backend)
+        self.max_chars = max_chars
+
+    def rerank(self, query, docs, k, embeddings=None, vector_store=None):
+        if len(docs) <= 1:
+            return list(docs)[:k]
+        pairs = [(query, html_to_text(doc.page_content)[:self.max_chars]) for doc in docs]
+        scores = np.asarray(self.model.predict(pairs), dtype=np.float32)
+        order = np.argsort(-scores, kind="stable")[:k]
+        return [docs[i] for i in order]
+
+def _min_max(scores):
+    """점수를 0~1 범위로 맞춤. 모두 같으면 0으로 둠."""
+    low, high = float(scores.min()), float(scores.max())
+    return (scores - low) / (high - low) if high > low else np.zeros_like(scores)
+
+def _unit_rows(vectors):
+    """행마다 길이를 1로 맞춤. 길이가 0인 행은 그대로 둠."""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1.0, norms)
+
+def _diverse_order(scores, vectors, k, diversity):
+    """
+    관련도(0~1)에서 이미 고른 문서와의 최대 코사인 유사도를 diversity 비중만큼 뺀 값이 가장 큰 문서를
+    하나씩 골라 k개의 순서를 반환함. (max marginal relevance)
+    """
+    selected = []
+    max_similarity = np.zeros(len(scores), dtype=np.float32)
+    remaining = np.ones(len(scores), dtype=bool)
+    for _ in range(min(k, len(scores))):
+        values = np.where(remaining, (1 - diversity) * scores - diversity * max_similarity, -np.inf)
+        best = int(np.argmax(values))
+        selected.append(best)
+        remaining[best] = False
+        max_similarity = np.maximum(max_similarity, vectors @ vectors[best])
+    return selected